@@ -1,9 +1,54 @@
 import pygame
 import sys
-import random
+import argparse
+import logging
 from pygame.math import Vector2
-import json
-import os
+import time
+import random
+from collections import deque
+from itertools import islice
+
+from engine import SnakeEngine, DIRECTIONS, OPPOSITE, EAT
+from text_cache import get_font, render_text
+from highscores import ScoreStore, WriteBehind, DIFFICULTIES, TICK_MS
+from replay import Replay, replay_path, write_replays, MAX_SEED
+from savegame import SavedGame, SAVE_PATH
+from profiler import FrameProfiler, ProfilerOverlay
+from autopilot import Autopilot, hamiltonian_cycle
+from keys import KEY_DIRECTIONS
+from sprites import HEAD_SPRITES, TAIL_SPRITES, JOINT_SPRITES, step_code
+from assets import AssetLoader
+
+log = logging.getLogger(__name__)
+
+class Layer:
+    # A surface composed once and reused while the state it shows stays the
+    # same. get() redraws through render() only when key changes.
+    def __init__(self):
+        self.surface = None
+        self.key = None
+
+    def get(self, key, render):
+        if self.surface is None or key != self.key:
+            self.surface = render()
+            self.key = key
+        return self.surface
+
+    def invalidate(self):
+        self.surface = None
+
+
+_dim_layers = {}
+
+
+def dim_layer(size, alpha):
+    # Translucent black over the whole window. Surface alpha instead of
+    # per-pixel alpha gives the same shade and blends faster.
+    layer = _dim_layers.get((size, alpha))
+    if layer is None:
+        layer = _dim_layers[(size, alpha)] = pygame.Surface(size)
+        layer.set_alpha(alpha)
+    return layer
 
 class Button:
     def __init__(self, x, y, width, height, text, color, hover_color, text_color=(255, 255, 255)):
@@ -13,16 +58,25 @@ class Button:
         self.hover_color = hover_color
         self.text_color = text_color
         self.is_hovered = False
+        # Both looks of the button, rendered on first use
+        self.images = {}
 
     def draw(self, surface):
-        color = self.hover_color if self.is_hovered else self.color
-        pygame.draw.rect(surface, color, self.rect, border_radius=5)
-        pygame.draw.rect(surface, (0, 0, 0), self.rect, 2, border_radius=5)
-        
-        font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 25)
-        text_surface = font.render(self.text, True, self.text_color)
-        text_rect = text_surface.get_rect(center=self.rect.center)
-        surface.blit(text_surface, text_rect)
+        image = self.images.get(self.is_hovered)
+        if image is None:
+            image = self.images[self.is_hovered] = self.render(self.is_hovered)
+        surface.blit(image, self.rect)
+
+    def render(self, hovered):
+        image = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        rect = image.get_rect()
+        pygame.draw.rect(image, self.hover_color if hovered else self.color, rect, border_radius=5)
+        pygame.draw.rect(image, (0, 0, 0), rect, 2, border_radius=5)
+
+        text_surface = render_text(self.text, 25, self.text_color)
+        text_rect = text_surface.get_rect(center=rect.center)
+        image.blit(text_surface, text_rect)
+        return image
 
     def check_hover(self, pos):
         self.is_hovered = self.rect.collidepoint(pos)
@@ -40,62 +94,57 @@ class Modal:
         self.title = title
         self.content = content
         self.visible = False
-        self.rect = pygame.Rect(
-            (screen.get_width() - width) // 2,
-            (screen.get_height() - height) // 2,
-            width,
-            height
-        )
-        self.close_button = Button(
-            self.rect.right - 40, self.rect.top + 10, 
-            35, 35, "X", (200, 50, 50), (250, 70, 70))
-        
+        # Centred on whatever surface it is drawn on
+        self.rect = pygame.Rect(0, 0, width, height)
+        self.close_button = Button(0, 0, 35, 35, "X", (200, 50, 50), (250, 70, 70))
+        self.panel = Layer()
+
     def draw(self, surface):
         if not self.visible:
             return
-            
-       
-        s = pygame.Surface((screen.get_width(), screen.get_height()), pygame.SRCALPHA)
-        s.fill((0, 0, 0, 180))
-        surface.blit(s, (0, 0))
-        
-        
-        pygame.draw.rect(surface, (240, 240, 240), self.rect, border_radius=15)
-        pygame.draw.rect(surface, (50, 50, 50), self.rect, 3, border_radius=15)
+
+        self.rect.center = surface.get_rect().center
+        self.close_button.rect.topleft = (self.rect.right - 40, self.rect.top + 10)
+
+        surface.blit(dim_layer(surface.get_size(), 180), (0, 0))
+        surface.blit(self.panel.get((self.title, self.content), self.render_panel), self.rect)
+        self.close_button.draw(surface)
+
+    def render_panel(self):
+        panel = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        rect = panel.get_rect()
+        pygame.draw.rect(panel, (240, 240, 240), rect, border_radius=15)
+        pygame.draw.rect(panel, (50, 50, 50), rect, 3, border_radius=15)
         
        
-        title_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 30)
-        title_surface = title_font.render(self.title, True, (50, 50, 150))
-        title_rect = title_surface.get_rect(center=(self.rect.centerx, self.rect.top + 40))
+        title_surface = render_text(self.title, 30, (50, 50, 150))
+        title_rect = title_surface.get_rect(center=(rect.centerx, rect.top + 40))
         
        
-        pygame.draw.rect(surface, (200, 200, 255), 
+        pygame.draw.rect(panel, (200, 200, 255), 
                             (title_rect.left - 20, title_rect.top - 10, 
                              title_rect.width + 40, title_rect.height + 10), 
                             border_radius=10)
-        pygame.draw.rect(surface, (50, 50, 150), 
+        pygame.draw.rect(panel, (50, 50, 150), 
                             (title_rect.left - 20, title_rect.top - 10, 
                              title_rect.width + 40, title_rect.height + 10), 
                             2, border_radius=10)
         
-        surface.blit(title_surface, title_rect)
+        panel.blit(title_surface, title_rect)
         
        
-        content_font = pygame.font.Font(None, 24)
         y_offset = title_rect.bottom + 20
         
         for line in self.content.split('\n'):
             if "════" in line:  
-                line_surface = content_font.render(line, True, (100, 100, 100))
+                line_surface = render_text(line, 24, (100, 100, 100), path=None)
             else:
-                line_surface = content_font.render(line, True, (0, 0, 0))
+                line_surface = render_text(line, 24, (0, 0, 0), path=None)
                 
-            line_rect = line_surface.get_rect(center=(self.rect.centerx, y_offset))
-            surface.blit(line_surface, line_rect)
+            line_rect = line_surface.get_rect(center=(rect.centerx, y_offset))
+            panel.blit(line_surface, line_rect)
             y_offset += 30
-        
-      
-        self.close_button.draw(surface)
+        return panel
         
     def handle_event(self, event):
         if not self.visible:
@@ -110,204 +159,497 @@ class Modal:
             
         return False
 
+class Camera:
+    # Scroll offset, in board pixels, of the window over a board that can be
+    # much larger than it
+    def __init__(self, board_width, board_height):
+        self.board_width = board_width
+        self.board_height = board_height
+        self.x = 0
+        self.y = 0
+
+    def follow(self, center):
+        view_width, view_height = screen.get_size()
+        x = min(max(round(center[0] - view_width / 2), 0), self.board_width * cell_size - view_width)
+        y = min(max(round(center[1] - view_height / 2), 0), self.board_height * cell_size - view_height)
+        moved = (x, y) != (self.x, self.y)
+        self.x, self.y = x, y
+        return moved
+
+    def visible_cells(self, rect=None):
+        # Range of cells whose sprites can reach rect (the whole window by
+        # default), counting the overhang that spills in from the top left
+        if rect is None:
+            rect = screen.get_rect()
+        span_width, span_height = apple.get_size()
+        first_x = max((self.x + rect.left - span_width) // cell_size + 1, 0)
+        first_y = max((self.y + rect.top - span_height) // cell_size + 1, 0)
+        last_x = min((self.x + rect.right - 1) // cell_size, self.board_width - 1)
+        last_y = min((self.y + rect.bottom - 1) // cell_size, self.board_height - 1)
+        return first_x, first_y, last_x, last_y
+
 class SNAKE:
-    def __init__(self):
-        self.reset()
-        self.load_graphics()
-        self.crunch_sound = pygame.mixer.Sound('Sound/Sound_crunch.wav')
+    def __init__(self, engine, camera):
+        self.engine = engine
+        self.camera = camera
+        self.alpha = 1.0
+        self.previous_tail = None
+        # Set by load_graphics once the assets are in
+        self.atlas = None
+        self.crunch_sound = None
+
+    @property
+    def direction(self):
+        return Vector2(DIRECTIONS[self.engine.direction])
+
+    @direction.setter
+    def direction(self, value):
+        self.engine.direction = DIRECTIONS.index((int(value.x), int(value.y)))
         
     def load_graphics(self):
-        self.head_up = pygame.image.load('Graphics/head_up.png').convert_alpha()
-        self.head_down = pygame.image.load('Graphics/head_down.png').convert_alpha()
-        self.head_right = pygame.image.load('Graphics/head_right.png').convert_alpha()
-        self.head_left = pygame.image.load('Graphics/head_left.png').convert_alpha()
-        
-        self.tail_up = pygame.image.load('Graphics/tail_up.png').convert_alpha()
-        self.tail_down = pygame.image.load('Graphics/tail_down.png').convert_alpha()
-        self.tail_right = pygame.image.load('Graphics/tail_right.png').convert_alpha()
-        self.tail_left = pygame.image.load('Graphics/tail_left.png').convert_alpha()
-        
-        self.body_vertical = pygame.image.load('Graphics/body_vertical.png').convert_alpha()
-        self.body_horizontal = pygame.image.load('Graphics/body_horizontal.png').convert_alpha()
-        self.body_tr = pygame.image.load('Graphics/body_tr.png').convert_alpha()
-        self.body_tl = pygame.image.load('Graphics/body_tl.png').convert_alpha()
-        self.body_br = pygame.image.load('Graphics/body_br.png').convert_alpha()
-        self.body_bl = pygame.image.load('Graphics/body_bl.png').convert_alpha()
+        self.atlas = atlas
+        self.crunch_sound = crunch_sound
+        self.head_areas = [sprite_areas[name] for name in HEAD_SPRITES]
+        self.tail_areas = [sprite_areas[name] for name in TAIL_SPRITES]
+        # Flat, indexed by the engine's to_tail * 4 + to_head joint codes
+        self.joint_areas = [sprite_areas.get(name) for row in JOINT_SPRITES for name in row]
 
     def draw_snake(self):
-        self.update_head_graphics()
-        self.update_tail_graphics()
-        
-        for index, block in enumerate(self.body):
-            x_pos = int(block.x * cell_size)
-            y_pos = int(block.y * cell_size)
-            block_rect = pygame.Rect(x_pos, y_pos, cell_size, cell_size)
-            
+        body = self.engine.body
+        last = len(body) - 1
+        joints = self.engine.joints
+        width = self.engine.width
+        joint_areas = self.joint_areas
+        atlas = self.atlas
+        camera_x, camera_y = self.camera.x, self.camera.y
+
+        first_x, first_y, last_x, last_y = self.camera.visible_cells()
+        if last - 1 <= (last_x - first_x + 1) * (last_y - first_y + 1):
+            segments = [(x, y) for x, y in islice(body, 1, last)]
+        else:
+            # A body longer than the window has cells: look up the segments
+            # on screen and put them back in body order for the overlaps
+            occupancy = self.engine.occupancy
+            entered = self.engine.entered
+            steps = self.engine.steps
+            found = []
+            for y in range(first_y, last_y + 1):
+                row = y * width
+                for x in range(first_x, last_x + 1):
+                    if occupancy[row + x]:
+                        index = steps - entered[row + x]
+                        if 0 < index < last:
+                            found.append((index, x, y))
+            found.sort()
+            segments = [(x, y) for index, x, y in found]
+
+        screen.blits([(atlas, (x * cell_size - camera_x, y * cell_size - camera_y), joint_areas[joints[y * width + x]])
+                      for x, y in segments], doreturn=False)
+
+        # Head last, so that while it slides out of the neck cell it stays
+        # on top of the neck
+        self.draw_block(body[last], last, last)
+        self.draw_block(body[0], 0, last)
+
+    def draw_block(self, pos, index, last):
+        x, y = pos
+        camera_x, camera_y = self.camera.x, self.camera.y
+        if index == last and self.alpha < 1 and self.previous_tail not in (None, pos):
+            # Until the tail has slid off, the new tail cell still shows
+            # the body piece that joined it to the old tail
+            code = self.engine.joints[y * self.engine.width + x]
+            screen.blit(self.atlas, (x * cell_size - camera_x, y * cell_size - camera_y), self.joint_areas[code])
+        block_rect = self.block_rect(pos, index, last).move(-camera_x, -camera_y)
+        screen.blit(self.atlas, block_rect, self.block_graphics(pos, index, last))
+        return block_rect
+
+    def block_rect(self, pos, index, last):
+        # Board pixel rect of a segment. Head and tail are drawn between their
+        # last two cells while alpha runs from 0 to 1 over a tick
+        x, y = pos
+        if self.alpha < 1 and self.previous_tail is not None:
             if index == 0:
-                screen.blit(self.head, block_rect)
-            elif index == len(self.body) - 1:
-                screen.blit(self.tail, block_rect)
+                from_x, from_y = self.engine.body[1]
+            elif index == last:
+                from_x, from_y = self.previous_tail
             else:
-                previous_block = self.body[index + 1] - block
-                next_block = self.body[index - 1] - block
-                
-                if previous_block.x == next_block.x:
-                    screen.blit(self.body_vertical, block_rect)
-                elif previous_block.y == next_block.y:
-                    screen.blit(self.body_horizontal, block_rect)
-                else:
-                    if previous_block.x == -1 and next_block.y == -1 or previous_block.y == -1 and next_block.x == -1:
-                        screen.blit(self.body_tl, block_rect)
-                    elif previous_block.x == -1 and next_block.y == 1 or previous_block.y == 1 and next_block.x == -1:
-                        screen.blit(self.body_bl, block_rect)
-                    elif previous_block.x == 1 and next_block.y == -1 or previous_block.y == -1 and next_block.x == 1:
-                        screen.blit(self.body_tr, block_rect)
-                    elif previous_block.x == 1 and next_block.y == 1 or previous_block.y == 1 and next_block.x == 1:
-                        screen.blit(self.body_br, block_rect)
-
-    def update_head_graphics(self):
-        if len(self.body) > 1:
-            head_relation = self.body[1] - self.body[0]
-            if head_relation == Vector2(1, 0): self.head = self.head_left
-            elif head_relation == Vector2(-1, 0): self.head = self.head_right
-            elif head_relation == Vector2(0, 1): self.head = self.head_up
-            elif head_relation == Vector2(0, -1): self.head = self.head_down
-
-    def update_tail_graphics(self):
-        if len(self.body) > 1:
-            tail_relation = self.body[-2] - self.body[-1]
-            if tail_relation == Vector2(1, 0): self.tail = self.tail_left
-            elif tail_relation == Vector2(-1, 0): self.tail = self.tail_right
-            elif tail_relation == Vector2(0, 1): self.tail = self.tail_up
-            elif tail_relation == Vector2(0, -1): self.tail = self.tail_down
-
-    def move_snake(self):
-        if self.new_block:
-            body_copy = self.body[:]
-            body_copy.insert(0, body_copy[0] + self.direction)
-            self.body = body_copy[:]
-            self.new_block = False
-        else:
-            body_copy = self.body[:-1]
-            body_copy.insert(0, body_copy[0] + self.direction)
-            self.body = body_copy[:]
+                from_x, from_y = x, y
+            x = from_x + (x - from_x) * self.alpha
+            y = from_y + (y - from_y) * self.alpha
+        return pygame.Rect(round(x * cell_size), round(y * cell_size), cell_size, cell_size)
 
-    def add_block(self):
-        self.new_block = True
+    def block_graphics(self, pos, index, last):
+        # Area of the atlas to draw for the segment at pos
+        if index == 0:
+            # A head that left the board has no joint record to read
+            return self.head_areas[step_code(pos, self.engine.body[1])]
+        code = self.engine.joints[pos[1] * self.engine.width + pos[0]]
+        if index == last:
+            return self.tail_areas[code & 3]
+        return self.joint_areas[code]
 
     def play_crunch_sound(self):
-        self.crunch_sound.play()
-
-    def reset(self):
-        self.body = [Vector2(5, 10), Vector2(4, 10), Vector2(3, 10)]
-        self.direction = Vector2(1, 0)  
-        self.new_block = False
+        if self.crunch_sound is not None:
+            self.crunch_sound.play()
 
 class FRUIT:
-    def __init__(self):
-        self.randomize()
-
-    def draw_fruit(self):
-        fruit_rect = pygame.Rect(int(self.pos.x * cell_size), int(self.pos.y * cell_size), cell_size, cell_size)
-        screen.blit(apple, fruit_rect)
+    def __init__(self, engine, camera):
+        self.engine = engine
+        self.camera = camera
 
-    def randomize(self):
-        self.x = random.randint(0, cell_number - 1)
-        self.y = random.randint(0, cell_number - 1)
-        self.pos = Vector2(self.x, self.y)
+    def draw_fruit(self, rect=None):
+        first_x, first_y, last_x, last_y = self.camera.visible_cells(rect)
+        for x, y in self.engine.fruits:
+            if first_x <= x <= last_x and first_y <= y <= last_y:
+                screen.blit(apple, (x * cell_size - self.camera.x, y * cell_size - self.camera.y))
 
 class MAIN:
-    def __init__(self):
-        self.snake = SNAKE()
-        self.fruit = FRUIT()
+    def __init__(self, board_width=None, board_height=None, player='', seed=None, score_store=None):
+        self.engine = SnakeEngine(board_width or cell_number, board_height or cell_number)
+        self.camera = Camera(self.engine.width, self.engine.height)
+        self.snake = SNAKE(self.engine, self.camera)
+        self.fruit = FRUIT(self.engine, self.camera)
         self.game_active = False
         self.game_over = False
-        self.score = 0
-        self.high_scores = self.load_high_scores()
+        # Opened on first use, which is after the welcome screen is up
+        self.score_store = score_store
+        self.best_scores = None
+        self.player = player
+        self.seed = seed
+        self.recording = None
+        self.replay = None
+        self.playback_speed = 1
+        self.replay_writer = WriteBehind(write_replays, name='ReplayWriter')
+        self.profiler = FrameProfiler()
+        self.started_at = time.perf_counter()
         self.difficulty = "Medium"  
+        self.background = None
+        self.background_key = None
+        self.dirty_cells = set()
+        self.full_redraw = True
+        self.score_rect = None
+        self.drawn_score = None
+        self.moving_rects = []
+        self.lag = 0.0
+        # Turns pressed but not taken yet, oldest first, with the time each
+        # press was read. Every tick takes one.
+        self.turns = deque()
+        # Press times of the turns taken since the last frame went out
+        self.unseen_turns = []
+        self.autopilot = None
+        self.autopilot_enabled = False
+        # Games the autopilot played any part of stay out of the high scores
+        self.assisted = False
+        # Menu screens, each composed once and redrawn only when what it
+        # shows changes
+        self.welcome_layer = Layer()
+        self.game_over_layer = Layer()
+        self.high_scores_layer = Layer()
+
+    @property
+    def score(self):
+        return self.engine.score
+
+    @property
+    def high_scores(self):
+        if self.best_scores is None:
+            self.best_scores = self.load_high_scores()
+        return self.best_scores
         
     def update(self):
         if self.game_active and not self.game_over:
-            self.snake.move_snake()
-            self.check_collision()
-            self.check_fail()
+            old_tail = self.engine.body[-1]
+            old_fruits = list(self.engine.fruits)
+            if self.replay is not None:
+                if self.engine.steps >= self.replay.ticks:
+                    # Recording stopped before the snake died
+                    self.end_game()
+                    return
+                reward, done, events = self.engine.step(self.replay.direction(self.engine.steps))
+            else:
+                action = None
+                if self.autopilot_enabled:
+                    self.snake.direction = Vector2(DIRECTIONS[self.autopilot.choose()])
+                elif self.turns:
+                    action, pressed = self.turns.popleft()
+                    self.unseen_turns.append(pressed)
+                reward, done, events = self.engine.step(action)
+                self.recording.record(self.engine.direction)
+            self.snake.previous_tail = old_tail
+            self.mark_dirty(old_tail, old_fruits)
+            if EAT in events:
+                self.snake.play_crunch_sound()
+                log.debug("Apple eaten, score: %d", self.score)
+            if done:
+                self.end_game()
+
+    def queue_turn(self, direction, pressed):
+        # Checked against the last turn still waiting rather than the
+        # current heading, so two presses within one tick both count and
+        # neither can turn the snake back into its neck
+        last = self.turns[-1][0] if self.turns else self.engine.direction
+        if direction in (last, OPPOSITE[last]) or len(self.turns) >= MAX_QUEUED_TURNS:
+            return False
+        self.turns.append((direction, pressed))
+        return True
+
+    def frame_shown(self, now):
+        # Latency of every turn the frame just shown took, from the key
+        # press being read. Time the press spent waiting in SDL's queue
+        # before that, up to one frame of clock.tick, is not counted.
+        for pressed in self.unseen_turns:
+            self.profiler.record_input(now - pressed)
+        self.unseen_turns.clear()
+
+    def advance(self, frame_time):
+        # Fixed-timestep logic: run as many ticks as the elapsed time covers
+        # and leave the remainder as the render interpolation factor
+        if not self.game_active or self.game_over:
+            self.lag = 0.0
+            self.snake.alpha = 1.0
+            return
+        tick_length = self.get_speed() / 1000
+        max_ticks = MAX_TICKS_PER_FRAME * (self.playback_speed if self.replay is not None else 1)
+        self.lag = min(self.lag + frame_time, tick_length * max_ticks)
+        while self.lag >= tick_length and not self.game_over:
+            self.profiler.record_tick(self.lag - tick_length)
+            self.update()
+            self.lag -= tick_length
+        self.snake.alpha = 1.0 if self.game_over else self.lag / tick_length
+
+    def mark_dirty(self, old_tail, old_fruits):
+        # After a tick only the old and new tail, the head, the neck and
+        # the fruit cells can look different
+        body = self.engine.body
+        self.dirty_cells.update((old_tail, body[0], body[1], body[-1]))
+        self.dirty_cells.update(old_fruits)
+        self.dirty_cells.update(self.engine.fruits)
+
+    def draw_dirty(self):
+        # Gameplay frames repaint only the damaged cells and return the rects
+        # to present. Anything else (reset, overlays, scrolling) takes a
+        # full redraw.
+        if self.follow_head() or self.full_redraw:
+            self.draw_elements()
+            self.full_redraw = False
+            self.dirty_cells.clear()
+            self.moving_rects = self.moving_spans()
+            return [screen.get_rect()]
+
+        # Sprites are larger than a cell and spill into the right and bottom
+        # neighbours, so the damaged area is a full sprite span
+        span_size = apple.get_size()
+        camera_x, camera_y = self.camera.x, self.camera.y
+        spans = [pygame.Rect((x * cell_size - camera_x, y * cell_size - camera_y), span_size) for x, y in self.dirty_cells]
+
+        # The interpolated head and tail move every frame: repaint where
+        # they were drawn last frame and where they go now
+        moving = self.moving_spans()
+        if moving != self.moving_rects:
+            spans += self.moving_rects + moving
+            self.moving_rects = moving
+        if not spans:
+            return []
+
+        screen_rect = screen.get_rect()
+        rects = []
+        for rect in spans:
+            rect = rect.clip(screen_rect)
+            if rect.width and rect.height:
+                self.repaint(rect)
+                rects.append(rect)
+
+        if self.score != self.drawn_score:
+            # A narrower score leaves part of the old score box behind
+            self.repaint(self.score_rect)
+            rects.append(self.score_rect)
+        rects.append(self.draw_score())
+        self.dirty_cells.clear()
+        return rects
+
+    def follow_head(self):
+        body = self.engine.body
+        return self.camera.follow(self.snake.block_rect(body[0], 0, len(body) - 1).center)
+
+    def moving_spans(self):
+        body = self.engine.body
+        last = len(body) - 1
+        return [pygame.Rect(self.snake.block_rect(body[index], index, last).move(-self.camera.x, -self.camera.y).topleft, apple.get_size())
+                for index in (0, last)]
+
+    def repaint(self, rect):
+        # Redraws everything that can overlap rect in the same order as
+        # draw_elements: grass, fruit, the snake body, then the head
+        first_x, first_y, last_x, last_y = self.camera.visible_cells(rect)
+
+        screen.set_clip(rect)
+        self.draw_grass(rect)
+        self.fruit.draw_fruit(rect)
+
+        body = self.engine.body
+        last = len(body) - 1
+        # Head and tail may be drawn away from their cells, include them always
+        segments = {last: body[last]}
+        for y in range(first_y, last_y + 1):
+            for x in range(first_x, last_x + 1):
+                index = self.engine.segment_index((x, y))
+                if index:
+                    segments[index] = (x, y)
+        for index in sorted(segments):
+            self.snake.draw_block(segments[index], index, last)
+        self.snake.draw_block(body[0], 0, last)
+        screen.set_clip(None)
 
     def draw_elements(self):
         if self.game_active:
-            self.draw_grass()
-            self.fruit.draw_fruit()
-            self.snake.draw_snake()
-            self.draw_score()
-            
             if self.game_over:
                 self.draw_game_over()
+            else:
+                self.draw_board()
         else:
             self.draw_welcome_screen()
 
-    def check_collision(self):
-        if self.fruit.pos == self.snake.body[0]:
-            self.fruit.randomize()
-            self.snake.add_block()
-            self.score += 1 
-            self.snake.play_crunch_sound()
-            print(f"Apple eaten, score: {self.score}")
-            
-            for block in self.snake.body[1:]:
-                if block == self.fruit.pos:
-                    self.fruit.randomize()
-
-    def check_fail(self):
-       
-        if not 0 <= self.snake.body[0].x < cell_number or not 0 <= self.snake.body[0].y < cell_number:
-            self.end_game()
-            
-        
-        for block in self.snake.body[1:]:
-            if block == self.snake.body[0]:
-                self.end_game()
+    def draw_board(self):
+        self.draw_grass()
+        self.fruit.draw_fruit()
+        self.snake.draw_snake()
+        self.draw_score()
 
     def end_game(self):
         self.game_over = True
-        self.update_high_scores()
+        if self.replay is None and not self.assisted:
+            self.update_high_scores()
+            self.save_replay()
+
+    def set_autopilot(self, enabled):
+        if enabled and self.autopilot is None:
+            try:
+                self.autopilot = Autopilot(self.engine)
+            except ValueError as error:
+                log.warning("Autopilot unavailable: %s", error)
+                return
+        self.autopilot_enabled = enabled
+        self.turns.clear()
+        if enabled and self.game_active and not self.game_over:
+            self.assisted = True
+
+    def save_replay(self):
+        self.recording.score = self.score
+        self.replay_writer.submit((replay_path(self.difficulty, self.recording), self.recording))
         
-    def reset_game(self):
-        self.snake.reset()
-        self.fruit.randomize()
+    def reset_game(self, replay=None):
+        if self.snake.atlas is None:
+            load_assets()
+            self.snake.load_graphics()
+        # Every game gets its own seed, so that the seed and the recorded
+        # directions are enough to play it again
+        self.replay = replay
+        if replay is not None:
+            self.engine.fruit_count = replay.fruit_count
+            seed = replay.seed
+        elif self.seed is not None:
+            seed = self.seed
+        else:
+            seed = random.getrandbits(32)
+        self.engine.reset(seed)
+        self.assisted = self.autopilot_enabled
+        self.recording = None if replay is not None else Replay.for_engine(self.engine, self.get_speed())
+        self.start_playing()
+
+    def start_playing(self, elapsed=0.0):
         self.game_over = False
-        self.score = 0
         self.game_active = True
-        
-        
-        pygame.time.set_timer(SCREEN_UPDATE, self.get_speed())
+        self.full_redraw = True
+        self.lag = 0.0
+        self.turns.clear()
+        self.unseen_turns.clear()
+        self.snake.previous_tail = None
+        self.started_at = time.perf_counter() - elapsed
+        self.game_over_layer.invalidate()
+
+    def save_game(self, path=SAVE_PATH):
+        # Only a game being played; a replay is a file already
+        if not self.game_active or self.game_over or self.replay is not None:
+            return False
+        saved = SavedGame(self.engine.snapshot(), self.recording, self.difficulty,
+                          time.perf_counter() - self.started_at, self.assisted)
+        try:
+            saved.save(path)
+        except OSError as error:
+            log.warning("Could not write %s: %s", path, error)
+            return False
+        log.info("Saved the game to %s", path)
+        return True
+
+    def resume_game(self, saved):
+        # Carries on exactly where save_game left off, apples to come
+        # included. The engine is restored in place, since the sprites and
+        # the autopilot hold on to it.
+        recording = saved.recording
+        if (recording.width, recording.height) != (self.engine.width, self.engine.height):
+            log.warning("The saved game is on a %dx%d board, not %dx%d", recording.width, recording.height,
+                        self.engine.width, self.engine.height)
+            return False
+        if self.snake.atlas is None:
+            load_assets()
+            self.snake.load_graphics()
+        try:
+            self.engine.restore(saved.snapshot)
+        except ValueError as error:
+            log.warning("Could not resume the saved game: %s", error)
+            return False
+        self.replay = None
+        self.recording = recording
+        self.difficulty = saved.difficulty
+        self.assisted = saved.assisted or self.autopilot_enabled
+        self.start_playing(saved.elapsed)
+        return True
 
     def get_speed(self):
-        if self.difficulty == "Easy":
-            return 200  
-        elif self.difficulty == "Medium":
-            return 150 
-        elif self.difficulty == "Hard":
-            return 100  
-        return 150  
-
-    def draw_grass(self):
+        if self.replay is not None:
+            return self.replay.tick_ms / self.playback_speed
+        return TICK_MS.get(self.difficulty, 150)
+
+    def draw_grass(self, rect=None):
+        # The checkerboard repeats every two cells, so a window-sized tile
+        # shifted by the camera covers any part of any board
+        if rect is None:
+            rect = screen.get_rect()
+        period = 2 * cell_size
+        screen.blit(self.get_background(), rect, rect.move(self.camera.x % period, self.camera.y % period))
+
+    def get_background(self):
+        # The checkerboard only changes with the cell geometry, so it is
+        # drawn once and reused as a single blit per frame
+        key = (cell_size, cell_number)
+        if self.background is None or self.background_key != key:
+            self.background = self.render_background()
+            self.background_key = key
+        return self.background
+
+    def render_background(self):
+        tile_cells = cell_number + 2
+        background = pygame.Surface((tile_cells * cell_size, tile_cells * cell_size)).convert()
+        background.fill((175, 215, 70))
         grass_color = (167, 209, 61)
-        for row in range(cell_number):
+        for row in range(tile_cells):
             if row % 2 == 0:
-                for col in range(cell_number):
+                for col in range(tile_cells):
                     if col % 2 == 0:
                         grass_rect = pygame.Rect(col * cell_size, row * cell_size, cell_size, cell_size)
-                        pygame.draw.rect(screen, grass_color, grass_rect)
+                        pygame.draw.rect(background, grass_color, grass_rect)
             else:
-                for col in range(cell_number):
+                for col in range(tile_cells):
                     if col % 2 != 0:
                         grass_rect = pygame.Rect(col * cell_size, row * cell_size, cell_size, cell_size)
-                        pygame.draw.rect(screen, grass_color, grass_rect)
+                        pygame.draw.rect(background, grass_color, grass_rect)
+        return background
 
     def draw_score(self):
         score_text = str(self.score)
-        score_surface = game_font.render(score_text, True, (56, 74, 12))
-        score_x = int(cell_size * cell_number - 60)
-        score_y = int(cell_size * cell_number - 40)
+        score_surface = render_text(score_text, 25, (56, 74, 12))
+        score_x = screen.get_width() - 60
+        score_y = screen.get_height() - 40
         score_rect = score_surface.get_rect(center=(score_x, score_y))
         apple_rect = apple.get_rect(midright=(score_rect.left, score_rect.centery))
         bg_rect = pygame.Rect(apple_rect.left, apple_rect.top, apple_rect.width + score_rect.width + 6, apple_rect.height)
@@ -316,101 +658,111 @@ class MAIN:
         screen.blit(score_surface, score_rect)
         screen.blit(apple, apple_rect)
         pygame.draw.rect(screen, (56, 74, 12), bg_rect, 2)
+        self.score_rect = bg_rect
+        self.drawn_score = self.score
+        return bg_rect
 
     def draw_welcome_screen(self):
-        print("Drawing welcome screen")
-        
-        screen.fill((175, 215, 70))
-        
-      
-        title_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 50)
-        title_surface = title_font.render("SNAKE GAME", True, (56, 74, 12))
-        title_rect = title_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//4))
-        screen.blit(title_surface, title_rect)
-        
-       
-        diff_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 30)
-        diff_surface = diff_font.render("Select Difficulty:", True, (56, 74, 12))
-        diff_rect = diff_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//2 - 80))
-        screen.blit(diff_surface, diff_rect)
-        
-   
+        log.debug("Drawing welcome screen")
+        screen.blit(self.welcome_layer.get((screen.get_size(), self.difficulty), self.render_welcome_screen), (0, 0))
+
         easy_button.rect.center = (screen.get_width()//2 - button_width - button_spacing//2, screen.get_height()//2 - 20)
         medium_button.rect.center = (screen.get_width()//2, screen.get_height()//2 - 20)
         hard_button.rect.center = (screen.get_width()//2 + button_width + button_spacing//2, screen.get_height()//2 - 20)
+        start_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 100)
+        highscores_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 160)
+        instructions_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 220)
+        quit_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 280)
         
-        for button in [easy_button, medium_button, hard_button]:
+        for button in welcome_buttons:
             button.draw(screen)
+
+    def render_welcome_screen(self):
+        layer = pygame.Surface(screen.get_size()).convert()
+        layer.fill((175, 215, 70))
         
+      
+        title_surface = render_text("SNAKE GAME", 50, (56, 74, 12))
+        title_rect = title_surface.get_rect(center=(layer.get_width()//2, layer.get_height()//4))
+        layer.blit(title_surface, title_rect)
         
-        current_diff_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 25)
-        current_diff_surface = current_diff_font.render(f"Current: {self.difficulty}", True, (56, 74, 12))
-        current_diff_rect = current_diff_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//2 + 30))
-        screen.blit(current_diff_surface, current_diff_rect)
+       
+        diff_surface = render_text("Select Difficulty:", 30, (56, 74, 12))
+        diff_rect = diff_surface.get_rect(center=(layer.get_width()//2, layer.get_height()//2 - 80))
+        layer.blit(diff_surface, diff_rect)
         
         
-        start_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 100)
-        highscores_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 160)
-        instructions_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 220)
-        quit_button.rect.center = (screen.get_width()//2, screen.get_height()//2 + 280)
+        current_diff_surface = render_text(f"Current: {self.difficulty}", 25, (56, 74, 12))
+        current_diff_rect = current_diff_surface.get_rect(center=(layer.get_width()//2, layer.get_height()//2 + 30))
+        layer.blit(current_diff_surface, current_diff_rect)
+        return layer
+
+    def is_new_high_score(self):
+        # Replays and autopilot games never reach the score store
+        if self.replay is not None or self.assisted:
+            return False
+        return self.score > 0 and self.score >= self.get_high_score_for_difficulty()
+
+    def draw_game_over(self):
+        key = (screen.get_size(), self.score, self.is_new_high_score())
+        screen.blit(self.game_over_layer.get(key, self.render_game_over), (0, 0))
+
+        restart_button.rect.center = (screen.get_width()//2 - button_width//2 - button_spacing//2, screen.get_height()//2 + 120)
+        menu_button.rect.center = (screen.get_width()//2 + button_width//2 + button_spacing//2, screen.get_height()//2 + 120)
+        quit_button_game_over.rect.center = (screen.get_width()//2, screen.get_height()//2 + 180)
         
-        for button in [start_button, highscores_button, instructions_button, quit_button]:
+        for button in game_over_buttons:
             button.draw(screen)
 
-    def draw_game_over(self):
-       
-        overlay = pygame.Surface((screen.get_width(), screen.get_height()), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 150))
-        screen.blit(overlay, (0, 0))
+    def render_game_over(self):
+        # The final board with the results on top. The board is drawn on the
+        # screen, as in a game, and copied from there.
+        self.draw_board()
+        screen.blit(dim_layer(screen.get_size(), 150), (0, 0))
         
-        game_over_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 50)
-        game_over_surface = game_over_font.render("GAME OVER", True, (255, 50, 50))
+        game_over_surface = render_text("GAME OVER", 50, (255, 50, 50))
         game_over_rect = game_over_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//3))
         screen.blit(game_over_surface, game_over_rect)
         
         
-        score_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 40)
-        score_surface = score_font.render(f"Score: {self.score}", True, (255, 255, 255))
+        score_surface = render_text(f"Score: {self.score}", 40, (255, 255, 255))
         score_rect = score_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//2))
         screen.blit(score_surface, score_rect)
         
-        if self.score > 0 and self.score >= self.get_high_score_for_difficulty():
-            high_score_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 30)
-            high_score_surface = high_score_font.render("New High Score!", True, (255, 215, 0))
+        if self.is_new_high_score():
+            high_score_surface = render_text("New High Score!", 30, (255, 215, 0))
             high_score_rect = high_score_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//2 + 50))
             screen.blit(high_score_surface, high_score_rect)
-        
-       
-        restart_button.rect.center = (screen.get_width()//2 - button_width//2 - button_spacing//2, screen.get_height()//2 + 120)
-        menu_button.rect.center = (screen.get_width()//2 + button_width//2 + button_spacing//2, screen.get_height()//2 + 120)
-        quit_button_game_over.rect.center = (screen.get_width()//2, screen.get_height()//2 + 180)
-        
-        for button in [restart_button, menu_button, quit_button_game_over]:
-            button.draw(screen)
+        return screen.copy()
 
     def load_high_scores(self):
-        try:
-            if os.path.exists('highscores.json'):
-                with open('highscores.json', 'r') as f:
-                    return json.load(f)
-        except:
-            pass
-        return {"Easy": 0, "Medium": 0, "Hard": 0}
-
-    def save_high_scores(self):
-        with open('highscores.json', 'w') as f:
-            json.dump(self.high_scores, f)
+        if self.score_store is None:
+            self.score_store = ScoreStore()
+        return self.score_store.best_scores()
 
     def update_high_scores(self):
+        # Every run is recorded; the store writes it on a background thread
+        high_scores = self.high_scores
+        self.score_store.record_run(self.difficulty, self.score, length=len(self.engine.body),
+                                    duration=time.perf_counter() - self.started_at,
+                                    seed=self.engine.seed, player=self.player)
         current_high = self.get_high_score_for_difficulty()
         if self.score > current_high:
-            self.high_scores[self.difficulty] = self.score
-            self.save_high_scores()
+            high_scores[self.difficulty] = self.score
 
     def get_high_score_for_difficulty(self):
         return self.high_scores.get(self.difficulty, 0)
 
     def draw_high_scores_modal(self):
+        scores = tuple(self.high_scores.get(difficulty, 0) for difficulty in DIFFICULTIES)
+        modal_surface = self.high_scores_layer.get(scores, self.render_high_scores_modal)
+        close_button_rect = pygame.Rect(modal_surface.get_width() - 60, 20, 40, 40)
+        modal_rect = modal_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//2))
+        screen.blit(modal_surface, modal_rect)
+        
+        return close_button_rect.move(modal_rect.topleft)
+
+    def render_high_scores_modal(self):
         
         modal_surface = pygame.Surface((600, 500), pygame.SRCALPHA)
         
@@ -420,8 +772,7 @@ class MAIN:
         pygame.draw.rect(modal_surface, (50, 50, 50), (0, 0, 580, 480), 3, border_radius=15)
         
         
-        title_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 40)
-        title_surface = title_font.render("HIGH SCORES", True, (50, 50, 50))
+        title_surface = render_text("HIGH SCORES", 40, (50, 50, 50))
         title_rect = title_surface.get_rect(center=(290, 60))
         
         
@@ -439,11 +790,10 @@ class MAIN:
        
         
         
-        header_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 30)
         y_offset = 120
         for diff in ["Easy", "Medium", "Hard"]:
             
-            diff_surface = header_font.render(diff, True, (255, 255, 255))
+            diff_surface = render_text(diff, 30, (255, 255, 255))
             diff_rect = diff_surface.get_rect(center=(290, y_offset))
             
            
@@ -466,8 +816,7 @@ class MAIN:
             modal_surface.blit(diff_surface, diff_rect)
             
             
-            score_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 35)
-            score_surface = score_font.render(str(self.high_scores.get(diff, 0)), True, (0, 0, 0))
+            score_surface = render_text(str(self.high_scores.get(diff, 0)), 35, (0, 0, 0))
             score_rect = score_surface.get_rect(center=(290, y_offset + 50))
            
             pygame.draw.rect(modal_surface, (255, 255, 255), 
@@ -493,45 +842,22 @@ class MAIN:
         
         pygame.draw.rect(modal_surface, (0, 0, 0), close_button_rect, 2, border_radius=20)
         
-        close_text = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 30).render("×", True, (255, 255, 255))
+        close_text = render_text("×", 30, (255, 255, 255))
         close_text_rect = close_text.get_rect(center=close_button_rect.center)
         modal_surface.blit(close_text, close_text_rect)
-        
-        
-        modal_rect = modal_surface.get_rect(center=(screen.get_width()//2, screen.get_height()//2))
-        screen.blit(modal_surface, modal_rect)
-        
-        return close_button_rect.move(modal_rect.topleft)
-
+        return modal_surface
 
-pygame.mixer.pre_init(44100, -16, 2, 512)
-pygame.init()
 
 cell_size = 35  
 cell_number = 20
-screen = pygame.display.set_mode((cell_number * cell_size, cell_number * cell_size))
-pygame.display.set_caption('Snake Game')
-clock = pygame.time.Clock()
-
 
-try:
-    apple = pygame.image.load('Graphics/apple.png').convert_alpha()
-except FileNotFoundError:
-    print("Error: Graphics/apple.png not found!")
-    sys.exit()
-
-try:
-    game_font = pygame.font.Font('Font/PoetsenOne-Regular.ttf', 25)
-except FileNotFoundError:
-    print("Error: Font/PoetsenOne-Regular.ttf not found!")
-    sys.exit()
-
-
-SCREEN_UPDATE = pygame.USEREVENT
-pygame.time.set_timer(SCREEN_UPDATE, 150)  
-
-main_game = MAIN()
+# Ticks the fixed-timestep loop may catch up on in one frame after a stall
+MAX_TICKS_PER_FRAME = 5
+# Turns waiting for their tick; presses beyond these are ignored
+MAX_QUEUED_TURNS = 3
 
+# Game sprites and sound, filled in by load_assets when the first game starts
+atlas = sprite_areas = apple = crunch_sound = None
 
 button_width = 150
 button_height = 50
@@ -551,111 +877,318 @@ restart_button = Button(0, 0, button_width, button_height, "Restart", (50, 150,
 menu_button = Button(0, 0, button_width, button_height, "Main Menu", (50, 50, 150), (70, 70, 200))
 quit_button_game_over = Button(0, 0, button_width, button_height, "Quit", (150, 50, 50), (200, 70, 70))
 
+welcome_buttons = (easy_button, medium_button, hard_button, start_button,
+                   highscores_button, instructions_button, quit_button)
+game_over_buttons = (restart_button, menu_button, quit_button_game_over)
 
-instructions_modal = Modal(
-    500, 400,  
-    "HOW TO PLAY",
-    "\n"
-    "Use arrow keys to control the snake\n"
-    "Eat apples to grow longer\n"
-    "Avoid walls and your own tail!\n"
-    "Game speeds up as you grow!\n"
-    "\n"
-    "Select difficulty before starting:\n"
-    " Easy: Slow and steady\n"
-    " Medium: Balanced challenge\n"
-    " Hard: Lightning speed!"
-)
 
-high_scores_modal_visible = False
-close_high_scores_rect = None
 
+def init_display():
+    # Only what the welcome screen needs; sprites and sound load in the
+    # background meanwhile
+    global screen, clock, asset_loader
 
-while True:
-    mouse_pos = pygame.mouse.get_pos()
-    
+    pygame.display.init()
+    pygame.font.init()
+
+    screen = pygame.display.set_mode((cell_number * cell_size, cell_number * cell_size))
+    pygame.display.set_caption('Snake Game')
+    clock = pygame.time.Clock()
+
+    asset_loader = AssetLoader()
+
+    # Fails here, before the first frame, if the font is missing
+    try:
+        get_font(25)
+    except FileNotFoundError:
+        log.error("Font/PoetsenOne-Regular.ttf not found!")
+        sys.exit()
+
+
+def load_assets():
+    global atlas, sprite_areas, apple, crunch_sound
+    if atlas is not None:
+        return
+    try:
+        atlas, sprite_areas, crunch_sound = asset_loader.get()
+    except (OSError, pygame.error) as error:
+        log.error("%s", error)
+        sys.exit()
+    apple = atlas.subsurface(sprite_areas['apple'])
+
+
+def load_saved_game(path):
+    try:
+        return SavedGame.load(path)
+    except (OSError, ValueError) as error:
+        log.warning("Could not load %s: %s", path, error)
+        return None
+
+
+def board_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}")
+    if width < cell_number or height < cell_number:
+        raise argparse.ArgumentTypeError(f"the board must be at least {cell_number}x{cell_number}")
+    return width, height
+
+
+def playback_speed(value):
+    speed = int(value)
+    if not 1 <= speed <= 64:
+        raise argparse.ArgumentTypeError("the replay speed must be from 1 to 64")
+    return speed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Snake Game")
+    parser.add_argument('--board', type=board_size, default=(cell_number, cell_number), metavar='WIDTHxHEIGHT',
+                        help="board size in cells; boards larger than the window scroll with the snake")
+    parser.add_argument('--player', default='', help="name recorded with every finished run")
+    parser.add_argument('--seed', type=int, help="play every game with this seed instead of a random one")
+    parser.add_argument('--replay', metavar='FILE', help="watch a recorded game")
+    parser.add_argument('--speed', type=playback_speed, default=1, help="replay speed, from 1 to 64")
+    parser.add_argument('--log-level', default='warning', choices=('debug', 'info', 'warning', 'error'))
+    parser.add_argument('--demo', action='store_true',
+                        help="attract mode: the autopilot plays game after game")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="write per-frame timings to FILE (.csv or .json) on exit and when F4 is pressed")
+    parser.add_argument('--resume', nargs='?', const=SAVE_PATH, metavar='FILE',
+                        help=f"carry on a game saved with F5 (default {SAVE_PATH})")
+    parser.add_argument('--connect', metavar='HOST[:PORT]', help="join a shared board hosted by server.py")
+    parser.add_argument('--arena', type=int, metavar='SNAKES',
+                        help="watch SNAKES computer snakes share one board; small boards are enlarged to fit them")
+    args = parser.parse_args(argv)
+    if args.seed is not None and not 0 <= args.seed <= MAX_SEED:
+        parser.error(f"--seed must be from 0 to {MAX_SEED}")
+    if args.demo:
+        # Without the autopilot the demo would record unassisted games as
+        # real runs
+        if args.replay or args.resume:
+            parser.error("--demo cannot be combined with --replay or --resume")
+        try:
+            hamiltonian_cycle(*args.board)
+        except ValueError as error:
+            parser.error(f"the autopilot cannot play the demo: {error}")
+    return args
+
+
+def main(argv=None):
+    global main_game, instructions_modal
+
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+    if args.connect:
+        # Imported here so that single-player starts load no network code
+        from client import run_client
+        sys.exit(run_client(args.connect))
+    if args.arena:
+        from arena import run_arena, arena_side, CELLS_PER_SNAKE
+        width, height = args.board
+        if width * height < args.arena * CELLS_PER_SNAKE:
+            width = height = arena_side(args.arena)
+        sys.exit(run_arena(args.arena, width, height, args.seed))
+    init_display()
+
+    if args.replay:
+        try:
+            replay = Replay.load(args.replay)
+        except (OSError, ValueError) as error:
+            log.error("Could not load %s: %s", args.replay, error)
+            sys.exit()
+        main_game = MAIN(replay.width, replay.height, player=args.player)
+        main_game.playback_speed = args.speed
+        main_game.reset_game(replay)
+    elif args.resume:
+        saved = load_saved_game(args.resume)
+        if saved is None:
+            sys.exit()
+        main_game = MAIN(saved.recording.width, saved.recording.height, player=args.player, seed=args.seed)
+        main_game.resume_game(saved)
+    else:
+        main_game = MAIN(*args.board, player=args.player, seed=args.seed)
+        if args.demo:
+            main_game.set_autopilot(True)
+            main_game.reset_game()
+
+    instructions_modal = Modal(
+        500, 400,  
+        "HOW TO PLAY",
+        "\n"
+        "Use arrow keys to control the snake\n"
+        "Eat apples to grow longer\n"
+        "Avoid walls and your own tail!\n"
+        "Game speeds up as you grow!\n"
+        "\n"
+        "Select difficulty before starting:\n"
+        " Easy: Slow and steady\n"
+        " Medium: Balanced challenge\n"
+        " Hard: Lightning speed!"
+    )
+
+    high_scores_modal_visible = False
+    close_high_scores_rect = None
+    # What the last menu frame showed; a menu frame showing the same thing
+    # again is skipped
+    drawn_menu_state = None
+
+
+    # First frame as early as possible, then the rest of the startup work
+    main_game.draw_elements()
+    pygame.display.update()
+    main_game.best_scores = main_game.load_high_scores()
+
+    profiler = main_game.profiler
+    overlay = ProfilerOverlay(profiler)
+    trace_path = args.trace or 'trace.csv'
+
+    def export_trace():
+        try:
+            frames = profiler.export(trace_path)
+        except OSError as error:
+            log.warning("Could not write %s: %s", trace_path, error)
+        else:
+            log.info("Wrote %d frames to %s", frames, trace_path)
+
+    def quit_game():
+        if args.trace:
+            export_trace()
+        pygame.quit()
+        sys.exit()
+
+    previous_time = time.perf_counter()
+
+    while True:
+        profiler.start_frame()
+        if args.demo and main_game.game_over:
+            main_game.reset_game()
+        playing = main_game.game_active and not main_game.game_over
+        if playing:
+            events = pygame.event.get()
+        else:
+            # Menus and modals only change on input, so sleep until some arrives
+            events = [pygame.event.wait()] + pygame.event.get()
+
+        now = time.perf_counter()
+        frame_time = now - previous_time if playing else 0.0
+        previous_time = now
+
+        mouse_pos = pygame.mouse.get_pos()
     
-    if not main_game.game_active or main_game.game_over:
-        for button in [easy_button, medium_button, hard_button, start_button, 
-                        highscores_button, instructions_button, quit_button,
-                        restart_button, menu_button, quit_button_game_over]:
-            button.check_hover(mouse_pos)
     
- 
-    if high_scores_modal_visible:
-        print("Drawing high scores modal")
-        close_high_scores_rect = main_game.draw_high_scores_modal()
+        if not main_game.game_active:
+            for button in welcome_buttons:
+                button.check_hover(mouse_pos)
+        elif main_game.game_over:
+            for button in game_over_buttons:
+                button.check_hover(mouse_pos)
     
     
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            pygame.quit()
-            sys.exit()
-            
-        if event.type == SCREEN_UPDATE and main_game.game_active and not main_game.game_over:
-            main_game.update()
+        for event in events:
+            if event.type == pygame.QUIT:
+                quit_game()
+            if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                drawn_menu_state = None
+
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                overlay.toggle()
+                main_game.full_redraw = True
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                export_trace()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F2 and main_game.replay is None:
+                main_game.set_autopilot(not main_game.autopilot_enabled)
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                main_game.save_game()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+                saved = load_saved_game(SAVE_PATH)
+                if saved is not None:
+                    main_game.resume_game(saved)
             
-        if event.type == pygame.KEYDOWN and main_game.game_active and not main_game.game_over:
-            if event.key == pygame.K_UP and main_game.snake.direction.y != 1:
-                main_game.snake.direction = Vector2(0, -1)
-            if event.key == pygame.K_RIGHT and main_game.snake.direction.x != -1:
-                main_game.snake.direction = Vector2(1, 0)
-            if event.key == pygame.K_DOWN and main_game.snake.direction.y != -1:
-                main_game.snake.direction = Vector2(0, 1)
-            if event.key == pygame.K_LEFT and main_game.snake.direction.x != 1:
-                main_game.snake.direction = Vector2(-1, 0)
+            if (event.type == pygame.KEYDOWN and event.key in KEY_DIRECTIONS and main_game.game_active
+                    and not main_game.game_over and main_game.replay is None and not main_game.autopilot_enabled):
+                # Stamped with the time the events were read
+                main_game.queue_turn(KEY_DIRECTIONS[event.key], now)
     
-        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             
-            if not main_game.game_active:
-                if easy_button.is_clicked(mouse_pos, event):
-                    main_game.difficulty = "Easy"
-                elif medium_button.is_clicked(mouse_pos, event):
-                    main_game.difficulty = "Medium"
-                elif hard_button.is_clicked(mouse_pos, event):
-                    main_game.difficulty = "Hard"
-                elif start_button.is_clicked(mouse_pos, event):
-                    main_game.reset_game()
-                elif highscores_button.is_clicked(mouse_pos, event):
-                    print("High Scores button clicked")
-                    high_scores_modal_visible = True
-                elif instructions_button.is_clicked(mouse_pos, event):
-                    instructions_modal.visible = True
-                elif quit_button.is_clicked(mouse_pos, event):
-                    pygame.quit()
-                    sys.exit()
+                if not main_game.game_active:
+                    if easy_button.is_clicked(mouse_pos, event):
+                        main_game.difficulty = "Easy"
+                    elif medium_button.is_clicked(mouse_pos, event):
+                        main_game.difficulty = "Medium"
+                    elif hard_button.is_clicked(mouse_pos, event):
+                        main_game.difficulty = "Hard"
+                    elif start_button.is_clicked(mouse_pos, event):
+                        main_game.reset_game()
+                    elif highscores_button.is_clicked(mouse_pos, event):
+                        log.debug("High Scores button clicked")
+                        high_scores_modal_visible = True
+                    elif instructions_button.is_clicked(mouse_pos, event):
+                        instructions_modal.visible = True
+                    elif quit_button.is_clicked(mouse_pos, event):
+                        quit_game()
                 
            
-            elif main_game.game_over:
-                if restart_button.is_clicked(mouse_pos, event):
-                    main_game.reset_game()
-                elif menu_button.is_clicked(mouse_pos, event):
-                    main_game.game_active = False
-                    main_game.game_over = False
-                elif quit_button_game_over.is_clicked(mouse_pos, event):
-                    pygame.quit()
-                    sys.exit()
+                elif main_game.game_over:
+                    if restart_button.is_clicked(mouse_pos, event):
+                        main_game.reset_game(main_game.replay)
+                    elif menu_button.is_clicked(mouse_pos, event):
+                        main_game.game_active = False
+                        main_game.game_over = False
+                    elif quit_button_game_over.is_clicked(mouse_pos, event):
+                        quit_game()
                 
             
-            if high_scores_modal_visible and close_high_scores_rect and close_high_scores_rect.collidepoint(mouse_pos):
-                high_scores_modal_visible = False
+                if high_scores_modal_visible and close_high_scores_rect and close_high_scores_rect.collidepoint(mouse_pos):
+                    high_scores_modal_visible = False
             
             
-            if instructions_modal.handle_event(event):
-                pass
+                if instructions_modal.handle_event(event):
+                    pass
     
     
-    screen.fill((175, 215, 70))
-    main_game.draw_elements()
-    
+        profiler.mark('events')
+        main_game.advance(frame_time)
+        profiler.mark('update')
+
+        if main_game.game_active and not main_game.game_over:
+            rects = main_game.draw_dirty()
+            if overlay.visible:
+                rects.append(overlay.draw(screen))
+            profiler.mark('draw')
+            pygame.display.update(rects)
+            drawn_menu_state = None
+        else:
+            # Mouse moves that change no hover state redraw nothing
+            menu_state = (main_game.game_active, main_game.game_over, main_game.difficulty, screen.get_size(),
+                          tuple(button.is_hovered for button in welcome_buttons + game_over_buttons),
+                          instructions_modal.visible, instructions_modal.close_button.is_hovered,
+                          high_scores_modal_visible)
+            if menu_state != drawn_menu_state or overlay.visible:
+                drawn_menu_state = menu_state
+                main_game.full_redraw = True
+                main_game.draw_elements()
+                profiler.mark('draw')
 
-    if instructions_modal.visible:
-        instructions_modal.draw(screen)
+                if instructions_modal.visible:
+                    instructions_modal.draw(screen)
 
-   
-    if high_scores_modal_visible:
-        print("Drawing high scores modal")
-        close_high_scores_rect = main_game.draw_high_scores_modal()
-    
-    pygame.display.update()
-    clock.tick(60)
\ No newline at end of file
+                if high_scores_modal_visible:
+                    log.debug("Drawing high scores modal")
+                    close_high_scores_rect = main_game.draw_high_scores_modal()
+                if overlay.visible:
+                    overlay.draw(screen)
+                profiler.mark('modals')
+
+                pygame.display.update()
+        main_game.frame_shown(time.perf_counter())
+        profiler.mark('display')
+        clock.tick(60)
+        profiler.mark('wait')
+        profiler.end_frame()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import argparse
+import logging
+import math
+import random
+import sys
+import time
+from collections import Counter
+
+import pygame
+
+from board_colors import MAX_WINDOW, MAX_CELL_SIZE, GRASS_COLORS, snake_color
+from engine import DIRECTIONS, OPPOSITE
+from world import World, RESPAWN_TICKS, NO_OWNER, START_LENGTH
+from profiler import FrameProfiler, ProfilerOverlay
+from text_cache import get_font
+
+log = logging.getLogger(__name__)
+
+# Board cells per snake when the arena picks its own board size
+CELLS_PER_SNAKE = 50
+# Snake colors; snake ids share them modulo this
+PALETTE_SIZE = 32
+# Fruits a bot looks at when it picks a new one to chase
+TARGET_SAMPLE = 8
+MAX_TICKS_PER_FRAME = 5
+
+
+def arena_side(snakes):
+    return math.isqrt(snakes * CELLS_PER_SNAKE) + 1
+
+
+class Arena:
+    # Hundreds of computer-controlled snakes on one World, with no network
+    # in between. Each bot keeps the fruit it is heading for until someone
+    # eats it, then picks the nearest of a few random fruits, so a tick
+    # costs O(snakes) however many fruits there are. The sample also keeps
+    # the bots from all chasing the same fruit into each other, and a bot
+    # steers clear of cells the bots before it have claimed this tick.
+
+    def __init__(self, width, height, snakes=200, fruit_count=None, seed=None):
+        self.world = World(width, height, seed=seed, fruit_count=fruit_count or max(1, snakes // 2))
+        self.rng = random.Random(seed)
+        self.targets = {}
+        self.respawn_at = {}
+        self.deaths = Counter()
+        for snake_id in range(snakes):
+            if self.world.add_snake(snake_id) is None:
+                self.respawn_at[snake_id] = 0
+
+    def step(self):
+        world = self.world
+        for snake_id, tick in list(self.respawn_at.items()):
+            if world.tick >= tick:
+                if world.add_snake(snake_id) is not None:
+                    del self.respawn_at[snake_id]
+                else:
+                    self.respawn_at[snake_id] = world.tick + RESPAWN_TICKS
+
+        fruits = tuple(world.fruits)
+        claimed = set()
+        for snake in world.snakes.values():
+            snake.next_direction = self.choose(snake, fruits, claimed)
+
+        delta = world.step()
+        for snake_id, cause in delta.deaths:
+            self.deaths[cause] += 1
+            self.targets.pop(snake_id, None)
+            self.respawn_at[snake_id] = world.tick + RESPAWN_TICKS
+        return delta
+
+    def choose(self, snake, fruits, claimed):
+        # Toward its fruit through a cell nobody is on, if there is one
+        world = self.world
+        width, height = world.width, world.height
+        head = snake.body[0]
+        x, y = head % width, head // width
+        target = self.targets.get(snake.id)
+        if target not in world.fruits:
+            sample = self.rng.sample(fruits, min(TARGET_SAMPLE, len(fruits)))
+            target = min(sample, key=lambda cell: abs(cell % width - x) + abs(cell // width - y), default=None)
+            self.targets[snake.id] = target
+        target_x, target_y = (target % width, target // width) if target is not None else (x, y)
+
+        owner = world.owner
+        best, best_cell, best_distance = snake.direction, None, None
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            if direction == OPPOSITE[snake.direction]:
+                continue
+            nx, ny = x + dx, y + dy
+            cell = ny * width + nx
+            if not (0 <= nx < width and 0 <= ny < height) or owner[cell] != NO_OWNER or cell in claimed:
+                continue
+            distance = abs(target_x - nx) + abs(target_y - ny)
+            if best_distance is None or distance < best_distance:
+                best, best_cell, best_distance = direction, cell, distance
+        claimed.add(best_cell)
+        return best
+
+    def longest(self):
+        return max((len(snake.body) for snake in self.world.snakes.values()), default=0)
+
+
+class ArenaRenderer:
+    # Redraws the whole board each frame: one blit of the grass, then every
+    # snake cell and fruit in a single blits() call from a handful of
+    # prerendered tiles
+
+    def __init__(self, world, cell_size):
+        self.world = world
+        width, height = world.width, world.height
+        size = cell_size
+        self.background = pygame.Surface((width * size, height * size)).convert()
+        for y in range(height):
+            for x in range(width):
+                self.background.fill(GRASS_COLORS[(x + y) % 2], (x * size, y * size, size, size))
+        # Top-left corner of every cell, so a frame does no arithmetic per blit
+        self.positions = [(cell % width * size, cell // width * size) for cell in range(width * height)]
+
+        self.body_tiles = []
+        self.head_tiles = []
+        for index in range(PALETTE_SIZE):
+            color = snake_color(index)
+            tile = pygame.Surface((size, size)).convert()
+            tile.fill(color)
+            self.body_tiles.append(tile)
+            head = pygame.Surface((size, size)).convert()
+            head.fill(color.lerp((0, 0, 0), 0.4))
+            self.head_tiles.append(head)
+        apple = pygame.image.load('Graphics/apple.png').convert_alpha()
+        self.fruit_tile = pygame.transform.smoothscale(apple, (size, size))
+
+    def draw(self, surface):
+        surface.blit(self.background, (0, 0))
+        positions = self.positions
+        fruit_tile = self.fruit_tile
+        blits = [(fruit_tile, positions[cell]) for cell in self.world.fruits]
+        body_tiles = self.body_tiles
+        head_tiles = self.head_tiles
+        for snake in self.world.snakes.values():
+            body = snake.body
+            color = snake.id % PALETTE_SIZE
+            tile = body_tiles[color]
+            blits += [(tile, positions[cell]) for cell in body]
+            blits.append((head_tiles[color], positions[body[0]]))
+        surface.blits(blits, doreturn=False)
+        return len(blits)
+
+
+def run_arena(snakes, width, height, seed=None, tick_ms=50):
+    pygame.display.init()
+    pygame.font.init()
+    cell_size = max(1, min(MAX_CELL_SIZE, MAX_WINDOW // max(width, height)))
+    screen = pygame.display.set_mode((width * cell_size, height * cell_size))
+    pygame.display.set_caption(f'Snake Arena - {snakes} snakes')
+    clock = pygame.time.Clock()
+    font = get_font(18)
+
+    arena = Arena(width, height, snakes, seed=seed)
+    renderer = ArenaRenderer(arena.world, cell_size)
+    profiler = FrameProfiler()
+    overlay = ProfilerOverlay(profiler)
+    tick_length = tick_ms / 1000
+    lag = 0.0
+    previous = time.perf_counter()
+
+    while True:
+        profiler.start_frame()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return 0
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                overlay.toggle()
+        profiler.mark('events')
+
+        now = time.perf_counter()
+        lag += now - previous
+        previous = now
+        ticks = 0
+        while lag >= tick_length and ticks < MAX_TICKS_PER_FRAME:
+            profiler.record_tick(lag - tick_length)
+            arena.step()
+            lag -= tick_length
+            ticks += 1
+        if ticks == MAX_TICKS_PER_FRAME:
+            # Falling behind: slow the arena down rather than spiral
+            lag = 0.0
+        profiler.mark('update')
+
+        renderer.draw(screen)
+        deaths = ', '.join(f'{cause} {count}' for cause, count in sorted(arena.deaths.items()))
+        status = (f"{len(arena.world.snakes)} snakes, longest {arena.longest() - START_LENGTH}, "
+                  f"tick {arena.world.tick}   deaths: {deaths or 'none'}")
+        screen.blit(font.render(status, True, (56, 74, 12)), (10, 5))
+        if overlay.visible:
+            overlay.draw(screen)
+        profiler.mark('draw')
+        pygame.display.flip()
+        profiler.mark('display')
+        clock.tick(60)
+        profiler.mark('wait')
+        profiler.end_frame()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch hundreds of computer snakes share one board")
+    parser.add_argument('--snakes', type=int, default=300)
+    parser.add_argument('--board', metavar='WIDTHxHEIGHT', help="default: about 50 cells per snake")
+    parser.add_argument('--tick-ms', type=int, default=50)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--log-level', default='warning', choices=('debug', 'info', 'warning', 'error'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+    if args.board:
+        try:
+            width, height = (int(part) for part in args.board.lower().split('x'))
+        except ValueError:
+            parser.error(f"expected WIDTHxHEIGHT, got {args.board!r}")
+    else:
+        width = height = arena_side(args.snakes)
+    return run_arena(args.snakes, width, height, args.seed, args.tick_ms)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
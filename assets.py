@@ -0,0 +1,52 @@
+import logging
+import threading
+
+import pygame
+
+from sprites import load_atlas
+
+log = logging.getLogger(__name__)
+
+SOUND_PATH = 'Sound/Sound_crunch.wav'
+
+
+class AssetLoader:
+    # Decodes the sprites and opens the audio device on a background thread
+    # while the welcome screen is up. get() waits for whatever is left and
+    # does the conversion to the display format on the calling thread.
+
+    def __init__(self, graphics_directory='Graphics', sound_path=SOUND_PATH):
+        self.graphics_directory = graphics_directory
+        self.sound_path = sound_path
+        self.loaded = None
+        self.error = None
+        self.assets = None
+        self.thread = threading.Thread(target=self.run, name='AssetLoader', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            atlas, areas = load_atlas(self.graphics_directory)
+            self.loaded = (atlas, areas, self.load_sound())
+        except (OSError, pygame.error) as error:
+            self.error = error
+
+    def load_sound(self):
+        try:
+            pygame.mixer.pre_init(44100, -16, 2, 512)
+            pygame.mixer.init()
+        except pygame.error as error:
+            # No audio device: play without sound
+            log.warning("Sound disabled: %s", error)
+            return None
+        return pygame.mixer.Sound(self.sound_path)
+
+    def get(self):
+        # (atlas, sprite areas, crunch sound or None)
+        if self.assets is None:
+            self.thread.join()
+            if self.error is not None:
+                raise self.error
+            atlas, areas, sound = self.loaded
+            self.assets = (atlas.convert_alpha(), areas, sound)
+        return self.assets
@@ -0,0 +1,238 @@
+from array import array
+from collections import deque
+
+from engine import DIRECTIONS, OPPOSITE
+
+# Cells of the fruit distance map filled in per decision
+SEARCH_BUDGET = 256
+# Free cells kept between the head and the tail when taking a shortcut
+SAFETY_MARGIN = 3
+# Shortcuts leave empty cells inside the body that only open up again once
+# the tail has passed them. With fewer free cells than this share of the
+# board the snake sticks to the tour, or fruit eaten in the space left
+# ahead of the head could close it off.
+SHORTCUT_FREE_SHARE = 0.5
+
+
+def hamiltonian_cycle(width, height):
+    # Cells (x, y) in the order of a closed tour visiting every cell once.
+    # Rows are swept back and forth over columns 1.. and column 0 leads back
+    # to the start, which needs an even number of rows; boards with an odd
+    # number of rows and an even number of columns use the transposed tour.
+    if height % 2 and width % 2 == 0:
+        return [(x, y) for y, x in hamiltonian_cycle(height, width)]
+    if height % 2 or width < 2:
+        raise ValueError(f"a {width}x{height} board has no Hamiltonian cycle")
+    tour = []
+    for y in range(height):
+        columns = range(1, width) if y % 2 == 0 else range(width - 1, 0, -1)
+        tour.extend((x, y) for x in columns)
+    tour.extend((0, y) for y in range(height - 1, -1, -1))
+    return tour
+
+
+class Autopilot:
+    # Plays a SnakeEngine game by itself. The snake follows a Hamiltonian
+    # tour of the board, so it can always reach its tail, and cuts across
+    # the tour toward the fruit whenever the cut cannot trap it: the new
+    # head cell must lie ahead of the head and behind the tail on the tour,
+    # so the body stays in tour order and the way to the tail stays empty.
+    # Among the safe moves, a breadth-first distance map spreading from the
+    # fruit picks the one nearest to it. The map grows by SEARCH_BUDGET
+    # cells per decision instead of being rebuilt every tick.
+
+    def __init__(self, engine):
+        self.engine = engine
+        width, height = engine.width, engine.height
+        self.cells = width * height
+        tour = [y * width + x for x, y in hamiltonian_cycle(width, height)]
+        self.order = array('i', bytes(4 * self.cells))
+        for index, cell in enumerate(tour):
+            self.order[cell] = index
+        self.tour = tour
+
+        # (direction, neighbour cell) pairs of each cell, filled in by
+        # cell_neighbours the first time a cell is looked at. Building them
+        # all up front took over a second on a 500x500 board.
+        self.neighbours = [None] * self.cells
+        self.reset()
+
+    def reset(self):
+        # The body is only known to be in tour order after the snake has
+        # followed the tour for a whole body length
+        self.ordered = False
+        self.on_tour = 0
+        self.expected = None
+        self.target = None
+        self.distance = None
+        self.frontier = deque()
+        self.level = 0
+
+    def cell_neighbours(self, cell):
+        pairs = self.neighbours[cell]
+        if pairs is None:
+            width, height = self.engine.width, self.engine.height
+            x, y = cell % width, cell // width
+            pairs = self.neighbours[cell] = [(direction, (y + dy) * width + x + dx)
+                                             for direction, (dx, dy) in enumerate(DIRECTIONS)
+                                             if 0 <= x + dx < width and 0 <= y + dy < height]
+        return pairs
+
+    def next_on_tour(self, cell):
+        return self.tour[(self.order[cell] + 1) % self.cells]
+
+    def choose(self):
+        # Direction for the next tick
+        engine = self.engine
+        width = engine.width
+        x, y = engine.body[0]
+        head = y * width + x
+        if (engine.steps, head) != self.expected:
+            # A new game, or someone else steered since the last decision
+            self.reset()
+
+        fruit = None
+        if engine.fruits:
+            fruit_x, fruit_y = engine.fruits[0]
+            fruit = fruit_y * width + fruit_x
+            if fruit != self.target:
+                self.start_search(fruit)
+            self.search(SEARCH_BUDGET)
+
+        successor = self.next_on_tour(head)
+        if not self.ordered:
+            move = self.bootstrap_move(head, successor)
+        elif fruit is None or len(engine.free) < self.cells * SHORTCUT_FREE_SHARE:
+            move = successor
+        else:
+            move = self.shortcut(head, successor, fruit)
+
+        # The tick counts too: other moves can bring the head back to the
+        # same cell later
+        self.expected = (engine.steps + 1, move)
+        for direction, cell in self.cell_neighbours(head):
+            if cell == move:
+                return direction
+        # The head has left the board; any answer will do
+        return engine.direction
+
+    def bootstrap_move(self, head, successor):
+        engine = self.engine
+        if self.vacant(successor) and self.room(successor, stop_at_tail=True)[0]:
+            self.on_tour += 1
+            if self.on_tour > len(engine.body) + engine.new_block:
+                self.ordered = True
+            return successor
+        # The tour is blocked or leads into a pocket: take the open cell
+        # from which the tail can still be reached and that leaves the most
+        # room, and start over
+        self.on_tour = 0
+        best = successor
+        best_room = None
+        for direction, cell in self.cell_neighbours(head):
+            if direction == OPPOSITE[engine.direction] or not self.vacant(cell):
+                continue
+            room = self.room(cell)
+            if best_room is None or room > best_room:
+                best, best_room = cell, room
+        return best
+
+    def vacant(self, cell):
+        # Free, or the tail, which moves out on a tick that does not grow
+        # the snake
+        engine = self.engine
+        if not engine.occupancy[cell]:
+            return True
+        tail_x, tail_y = engine.body[-1]
+        return cell == tail_y * engine.width + tail_x and not engine.new_block and engine.occupancy[cell] == 1
+
+    def room(self, start, stop_at_tail=False):
+        # Breadth-first over what the head could reach after moving to
+        # start: whether that includes the tail end of the body, and how
+        # many cells it found. A body cell counts as open if its segment
+        # will have moved on by the time the head gets there.
+        engine = self.engine
+        occupancy = engine.occupancy
+        entered = engine.entered
+        steps = engine.steps
+        width = engine.width
+        length = len(engine.body) + engine.new_block + ((start % width, start // width) in engine.fruits)
+        cell_neighbours = self.cell_neighbours
+        seen = bytearray(self.cells)
+        seen[start] = 1
+        frontier = deque(((start, 1),))
+        reaches_tail = False
+        found = 1
+        while frontier:
+            cell, ticks = frontier.popleft()
+            ticks += 1
+            for direction, neighbour in cell_neighbours(cell):
+                if seen[neighbour]:
+                    continue
+                if occupancy[neighbour]:
+                    # A segment's index in the body is its age, and the
+                    # segment moves out length - index ticks from now
+                    if length - (steps - entered[neighbour]) > ticks:
+                        continue
+                    reaches_tail = True
+                    if stop_at_tail:
+                        return True, found
+                seen[neighbour] = 1
+                found += 1
+                frontier.append((neighbour, ticks))
+        return reaches_tail, found
+
+    def shortcut(self, head, successor, fruit):
+        engine = self.engine
+        order = self.order
+        cells = self.cells
+        tail_x, tail_y = engine.body[-1]
+        head_index = order[head]
+        to_tail = (order[tail_y * engine.width + tail_x] - head_index) % cells
+        to_fruit = (order[fruit] - head_index) % cells
+        # Never jump past the fruit, and leave room for the growth to come
+        limit = min(to_tail - SAFETY_MARGIN - engine.new_block, to_fruit)
+
+        distance = self.distance
+        # Once the search is over, cells it did not reach are cut off from
+        # the fruit
+        unreached = self.level + 1 if self.frontier else cells
+        occupancy = engine.occupancy
+        best = successor
+        best_key = None
+        for direction, cell in self.cell_neighbours(head):
+            if occupancy[cell]:
+                continue
+            ahead = (order[cell] - head_index) % cells
+            if cell != successor and not 0 < ahead <= limit:
+                continue
+            known = distance[cell]
+            key = (known if known >= 0 else unreached, -ahead)
+            if best_key is None or key < best_key:
+                best, best_key = cell, key
+        return best
+
+    def start_search(self, fruit):
+        self.target = fruit
+        self.distance = array('i', [-1]) * self.cells
+        self.distance[fruit] = 0
+        self.frontier = deque((fruit,))
+        self.level = 0
+
+    def search(self, budget):
+        # Breadth-first from the fruit around the body. Cells are labelled
+        # in order of distance, so a cell not reached yet is at least
+        # self.level + 1 away.
+        frontier = self.frontier
+        distance = self.distance
+        cell_neighbours = self.cell_neighbours
+        occupancy = self.engine.occupancy
+        while frontier and budget:
+            cell = frontier.popleft()
+            budget -= 1
+            step = distance[cell] + 1
+            self.level = step - 1
+            for direction, neighbour in cell_neighbours(cell):
+                if distance[neighbour] < 0 and not occupancy[neighbour]:
+                    distance[neighbour] = step
+                    frontier.append(neighbour)
@@ -0,0 +1,136 @@
+import numpy as np
+
+from engine import DIRECTIONS, OPPOSITE, RIGHT, start_body
+
+# Values of info['cause'] returned by BatchSnakeEnv.step
+CAUSE_NONE = 0
+CAUSE_WALL = 1
+CAUSE_SELF = 2
+CAUSE_WIN = 3
+
+_DX = np.array([dx for dx, dy in DIRECTIONS], dtype=np.int32)
+_DY = np.array([dy for dx, dy in DIRECTIONS], dtype=np.int32)
+_OPPOSITE = np.array(OPPOSITE, dtype=np.int8)
+
+
+class BatchSnakeEnv:
+    # Runs num_envs games of the SnakeEngine rules side by side. Every board is
+    # a row of flat cell indices (y * width + x): `grid` is the occupancy of
+    # each board and `body` is a ring buffer of snake cells running from
+    # tail_index to head_index. Finished games are reset inside step().
+
+    def __init__(self, num_envs, width=20, height=20, seed=None):
+        self.num_envs = num_envs
+        self.width = width
+        self.height = height
+        self.cells = width * height
+        self.rng = np.random.default_rng(seed)
+
+        self.grid = np.zeros((num_envs, self.cells), dtype=np.uint8)
+        self.body = np.zeros((num_envs, self.cells), dtype=np.int32)
+        self.head_index = np.zeros(num_envs, dtype=np.int32)
+        self.tail_index = np.zeros(num_envs, dtype=np.int32)
+        self.length = np.zeros(num_envs, dtype=np.int32)
+        self.direction = np.zeros(num_envs, dtype=np.int8)
+        self.new_block = np.zeros(num_envs, dtype=bool)
+        self.fruit = np.zeros(num_envs, dtype=np.int32)
+        self.score = np.zeros(num_envs, dtype=np.int32)
+        self.steps = np.zeros(num_envs, dtype=np.int32)
+
+        self._rows = np.arange(num_envs)
+        start = start_body(width, height)
+        self._start_cells = np.array([y * width + x for x, y in reversed(start)], dtype=np.int32)
+
+    def reset(self):
+        self._reset(self._rows)
+        return self.observe()
+
+    def step(self, actions=None):
+        rows = self._rows
+        cells = self.cells
+
+        if actions is not None:
+            actions = np.asarray(actions)
+            turn = (actions >= 0) & (actions != _OPPOSITE[self.direction])
+            self.direction = np.where(turn, actions, self.direction).astype(np.int8)
+
+        head = self.body[rows, self.head_index]
+        x = head % self.width + _DX[self.direction]
+        y = head // self.width + _DY[self.direction]
+        wall = (x < 0) | (x >= self.width) | (y < 0) | (y >= self.height)
+        new_head = np.where(wall, 0, y * self.width + x)
+
+        # The tail leaves before the head is tested, as in SnakeEngine.move_snake
+        shrink = rows[~self.new_block]
+        self.grid[shrink, self.body[shrink, self.tail_index[shrink]]] = 0
+        self.tail_index[shrink] = (self.tail_index[shrink] + 1) % cells
+        self.length += self.new_block
+        self.new_block[:] = False
+
+        hit_self = ~wall & (self.grid[rows, new_head] != 0)
+        dead = wall | hit_self
+
+        alive = rows[~dead]
+        moved = new_head[alive]
+        self.head_index[alive] = (self.head_index[alive] + 1) % cells
+        self.body[alive, self.head_index[alive]] = moved
+        self.grid[alive, moved] = 1
+        self.steps += 1
+
+        ate = ~dead & (new_head == self.fruit)
+        cause = np.where(wall, CAUSE_WALL, np.where(hit_self, CAUSE_SELF, CAUSE_NONE)).astype(np.int8)
+        eaters = rows[ate]
+        if eaters.size:
+            self.score[eaters] += 1
+            self.new_block[eaters] = True
+            won = eaters[~self._spawn_fruit(eaters)]
+            cause[won] = CAUSE_WIN
+
+        rewards = ate.astype(np.float32) - dead
+        dones = cause != CAUSE_NONE
+        info = {
+            'cause': cause,
+            'score': self.score.copy(),
+            'steps': self.steps.copy(),
+        }
+
+        if dones.any():
+            self._reset(rows[dones])
+        return self.observe(), rewards, dones, info
+
+    def observe(self):
+        # Planes per game: occupied cells, head, fruit
+        rows = self._rows
+        obs = np.zeros((self.num_envs, 3, self.cells), dtype=np.uint8)
+        obs[:, 0] = self.grid
+        obs[rows, 1, self.body[rows, self.head_index]] = 1
+        obs[rows, 2, self.fruit] = 1
+        return obs.reshape(self.num_envs, 3, self.height, self.width)
+
+    def snake_cells(self, index):
+        # Body of one game as (x, y) pairs, head first
+        order = (self.head_index[index] - np.arange(self.length[index])) % self.cells
+        return [(int(cell % self.width), int(cell // self.width)) for cell in self.body[index, order]]
+
+    def _reset(self, idx):
+        start = self._start_cells
+        self.grid[idx] = 0
+        self.grid[idx[:, None], start] = 1
+        self.body[idx, :len(start)] = start
+        self.tail_index[idx] = 0
+        self.head_index[idx] = len(start) - 1
+        self.length[idx] = len(start)
+        self.direction[idx] = RIGHT
+        self.new_block[idx] = False
+        self.score[idx] = 0
+        self.steps[idx] = 0
+        self._spawn_fruit(idx)
+
+    def _spawn_fruit(self, idx):
+        # Uniform draw over the free cells of each board: random keys with the
+        # occupied cells masked out, then the largest key wins.
+        keys = self.rng.random((len(idx), self.cells), dtype=np.float32)
+        keys[self.grid[idx] != 0] = -1.0
+        best = keys.argmax(axis=1)
+        self.fruit[idx] = best
+        return keys[np.arange(len(idx)), best] >= 0
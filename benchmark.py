@@ -0,0 +1,291 @@
+import os
+
+# Benchmarks run without a window or an audio device
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from engine import SnakeEngine, step_direction
+from autopilot import Autopilot
+from arena import Arena, ArenaRenderer, arena_side
+
+SNAKE_LENGTHS = (3, 10, 100, 1000, 10000)
+BOARD_FILLS = (0.10, 0.25, 0.50, 0.75, 0.90, 0.99)
+DRAW_LENGTHS = (3, 100, 1000, 10000)
+TICKS_PER_ROUND = 1000
+FILL_BOARD = 100
+DRAW_BOARD = 120
+AUTOPILOT_BOARDS = (20, 100)
+CLONE_BOARDS = (20, 100)
+ARENA_SNAKES = (100, 500)
+# Ticks an arena plays before it is measured, so the snakes have grown
+ARENA_WARMUP = 200
+
+# Up to the first frame of the welcome screen, which opens no score store
+STARTUP_SCRIPT = '''
+import pygame, app
+app.init_display()
+game = app.MAIN()
+game.draw_elements()
+pygame.display.update()
+'''
+
+
+def serpentine(width, height):
+    # Every cell of the board in one connected back-and-forth path
+    path = []
+    for y in range(height):
+        columns = range(width) if y % 2 == 0 else range(width - 1, -1, -1)
+        path.extend((x, y) for x in columns)
+    return path
+
+
+def snake_on_path(engine, path, length):
+    # Lays a snake along the first length cells of path, head last
+    engine.reset(body=path[length - 1::-1])
+    return [step_direction(a, b) for a, b in zip(path[length - 1:], path[length:])]
+
+
+def measure(func, number, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - started) / number)
+    return {
+        'median_us': statistics.median(times) * 1e6,
+        'min_us': min(times) * 1e6,
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def bench_tick(length, repeat):
+    # The board leaves room for the snake to run the whole benchmark along
+    # the path without hitting anything
+    side = math.isqrt(length + TICKS_PER_ROUND * repeat) + 1
+    engine = SnakeEngine(side, side, seed=0)
+    directions = iter(snake_on_path(engine, serpentine(side, side), length))
+
+    def tick():
+        engine.direction = next(directions)
+        engine.move_snake()
+        if engine.check_fail() is not None:
+            raise RuntimeError("the benchmark snake crashed")
+    return measure(tick, TICKS_PER_ROUND, repeat)
+
+
+def bench_spawn(fill, repeat):
+    engine = SnakeEngine(FILL_BOARD, FILL_BOARD, seed=0)
+    snake_on_path(engine, serpentine(FILL_BOARD, FILL_BOARD), int(FILL_BOARD * FILL_BOARD * fill))
+    width = engine.width
+
+    def spawn():
+        x, y = engine.place_fruit()
+        engine.fruits.pop()
+        engine.release_cell(y * width + x)
+    return measure(spawn, 5000, repeat)
+
+
+def bench_autopilot(side, repeat):
+    # One decision plus the tick it steers
+    engine = SnakeEngine(side, side, seed=0)
+    autopilot = Autopilot(engine)
+
+    def decide():
+        if engine.done:
+            engine.reset()
+        engine.step(autopilot.choose())
+    return measure(decide, 2000, repeat)
+
+
+def quarter_full(side):
+    engine = SnakeEngine(side, side, seed=0)
+    snake_on_path(engine, serpentine(side, side), side * side // 4)
+    engine.place_fruits(1)
+    return engine
+
+
+def bench_clone(side, repeat):
+    return measure(quarter_full(side).clone, 5000, repeat)
+
+
+def bench_snapshot(side, repeat):
+    # A save and a load
+    engine = quarter_full(side)
+    return measure(lambda: engine.restore(engine.snapshot()), 1000, repeat)
+
+
+def warm_arena(snakes):
+    side = arena_side(snakes)
+    arena = Arena(side, side, snakes, seed=0)
+    for _ in range(ARENA_WARMUP):
+        arena.step()
+    return arena
+
+
+def bench_arena(snakes, repeat):
+    # Bot decisions, respawns and the world step for every snake
+    return measure(warm_arena(snakes).step, 100, repeat)
+
+
+def game_with_snake(app, store, length):
+    side = DRAW_BOARD if length > 1000 else 40
+    game = app.MAIN(side, side, score_store=store)
+    game.reset_game()
+    snake_on_path(game.engine, serpentine(side, side), length)
+    game.follow_head()
+    return game
+
+
+def render_benchmarks(repeat, store):
+    import pygame
+    import app
+    app.init_display()
+    results = {}
+    for length in DRAW_LENGTHS:
+        game = game_with_snake(app, store, length)
+        results[f'draw_snake/length={length}'] = measure(game.snake.draw_snake, 50, repeat)
+
+    game = game_with_snake(app, store, 3)
+    results['draw_grass'] = measure(game.draw_grass, 50, repeat)
+    game.game_active = False
+    results['draw_welcome_screen'] = measure(game.draw_welcome_screen, 50, repeat)
+    results['draw_high_scores_modal'] = measure(game.draw_high_scores_modal, 50, repeat)
+
+    for snakes in ARENA_SNAKES:
+        arena = warm_arena(snakes)
+        renderer = ArenaRenderer(arena.world, 4)
+        surface = pygame.Surface(renderer.background.get_size()).convert()
+        results[f'draw_arena/snakes={snakes}'] = measure(lambda: renderer.draw(surface), 50, repeat)
+    return results
+
+
+def bench_startup(repeat):
+    times = []
+    for run in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', STARTUP_SCRIPT],
+                       check=True, capture_output=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        times.append(time.perf_counter() - started)
+    return {
+        'median_us': statistics.median(times) * 1e6,
+        'min_us': min(times) * 1e6,
+        'number': 1,
+        'repeat': repeat,
+    }
+
+
+def run_benchmarks(repeat=5, only=None):
+    from highscores import ScoreStore
+
+    def wanted(name):
+        return only is None or any(pattern in name for pattern in only)
+
+    results = {}
+    for length in SNAKE_LENGTHS:
+        name = f'tick/length={length}'
+        if wanted(name):
+            results[name] = bench_tick(length, repeat)
+    for fill in BOARD_FILLS:
+        name = f'spawn_fruit/fill={fill:.0%}'
+        if wanted(name):
+            results[name] = bench_spawn(fill, repeat)
+
+    for side in AUTOPILOT_BOARDS:
+        name = f'autopilot/board={side}x{side}'
+        if wanted(name):
+            results[name] = bench_autopilot(side, repeat)
+    for side in CLONE_BOARDS:
+        name = f'clone/board={side}x{side}'
+        if wanted(name):
+            results[name] = bench_clone(side, repeat)
+        name = f'snapshot_restore/board={side}x{side}'
+        if wanted(name):
+            results[name] = bench_snapshot(side, repeat)
+    for snakes in ARENA_SNAKES:
+        name = f'arena_step/snakes={snakes}'
+        if wanted(name):
+            results[name] = bench_arena(snakes, repeat)
+
+    with tempfile.TemporaryDirectory() as directory:
+        if any(wanted(name) for name in ('draw_snake', 'draw_grass', 'draw_welcome_screen', 'draw_high_scores_modal',
+                                         'draw_arena')):
+            store = ScoreStore(os.path.join(directory, 'scores.db'), os.path.join(directory, 'none.json'))
+            results.update((name, result) for name, result in render_benchmarks(repeat, store).items() if wanted(name))
+        if wanted('startup'):
+            results['startup'] = bench_startup(repeat)
+    return results
+
+
+def report(results):
+    import pygame
+    return {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(results, baseline, threshold):
+    # Names of the benchmarks that got slower than baseline by more than
+    # threshold (0.25 is 25 %). The fastest round is compared: it is the one
+    # least disturbed by whatever else the machine was doing.
+    regressions = []
+    for name, result in results.items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f"{name:<32} {result['min_us']:>12.2f} us   (not in baseline)")
+            continue
+        change = result['min_us'] / before['min_us'] - 1
+        flag = 'REGRESSION' if change > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<32} {before['min_us']:>12.2f} -> {result['min_us']:>12.2f} us  {change:>+7.1%}  {flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the game's tick, render and UI hot paths")
+    parser.add_argument('--output', metavar='FILE', help="write the results as JSON")
+    parser.add_argument('--compare', metavar='FILE', help="compare with a baseline JSON file and fail on regressions")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="slowdown that counts as a regression (default 0.25, i.e. 25%%)")
+    parser.add_argument('--repeat', type=int, default=5, help="timed rounds per benchmark (default 5)")
+    parser.add_argument('--only', nargs='+', metavar='NAME', help="run only benchmarks whose name contains NAME")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.repeat, args.only)
+    data = report(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=4)
+
+    if not args.compare:
+        for name, result in results.items():
+            print(f"{name:<32} {result['median_us']:>12.2f} us  (min {result['min_us']:.2f})")
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,15 @@
+import pygame
+
+# Window and colours shared by the multiplayer client and the arena
+
+# Largest window side in pixels; the cells shrink to fit bigger boards
+MAX_WINDOW = 800
+MAX_CELL_SIZE = 35
+GRASS_COLORS = ((175, 215, 70), (167, 209, 61))
+FRUIT_COLOR = (200, 40, 40)
+
+
+def snake_color(snake_id):
+    color = pygame.Color(0)
+    color.hsva = ((snake_id * 47) % 360, 65, 75, 100)
+    return color
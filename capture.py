@@ -0,0 +1,252 @@
+import os
+
+# Frames are drawn offscreen, without a window or an audio device
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import logging
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import app
+
+log = logging.getLogger(__name__)
+
+CAPTURE_DIRECTORY = 'captures'
+CHUNK_FRAMES = 256
+QUEUE_FRAMES = 64
+
+
+def pixel_view(surface, step=1):
+    # The pixels of a 32-bit surface as a (height, width) uint32 array
+    # without a copy, keeping every step-th pixel each way. Copying whole
+    # pixels is several times faster than copying RGB bytes out of them.
+    # The surface stays locked, and cannot be drawn on, until the view is
+    # gone.
+    width, height = surface.get_size()
+    pixels = np.frombuffer(surface.get_buffer(), dtype=np.uint32).reshape(height, surface.get_pitch() // 4)
+    return pixels[::step, :width:step]
+
+
+def rgb_channels(surface):
+    # Byte offsets of red, green and blue within the surface's pixels
+    offsets = [shift // 8 for shift in surface.get_shifts()[:3]]
+    return offsets if sys.byteorder == 'little' else [3 - offset for offset in offsets]
+
+
+def to_rgb(pixels, channels):
+    # (..., height, width) uint32 pixels to (..., height, width, 3) uint8
+    pixels = np.ascontiguousarray(pixels).view(np.uint8).reshape(*pixels.shape, 4)
+    return np.stack([pixels[..., channel] for channel in channels], axis=-1)
+
+
+def grid_planes(engine):
+    # The board as (3, height, width) uint8 planes: snake segments per
+    # cell, the head, the fruits. The same layout as BatchSnakeEnv.observe.
+    width, height = engine.width, engine.height
+    planes = np.zeros((3, height, width), dtype=np.uint8)
+    planes[0] = np.frombuffer(engine.occupancy, dtype=np.uint8).reshape(height, width)
+    x, y = engine.body[0]
+    if 0 <= x < width and 0 <= y < height:
+        planes[1, y, x] = 1
+    for x, y in engine.fruits:
+        planes[2, y, x] = 1
+    return planes
+
+
+class NpzSink:
+    # Frames in .npz files of chunk_frames frames each, saved with the game
+    # and tick each frame shows
+
+    def __init__(self, directory=CAPTURE_DIRECTORY, chunk_frames=CHUNK_FRAMES, compress=False):
+        self.directory = directory
+        self.chunk_frames = chunk_frames
+        self.save = np.savez_compressed if compress else np.savez
+        self.frames = []
+        self.games = []
+        self.ticks = []
+        self.chunks = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, frame, game, tick):
+        self.frames.append(frame)
+        self.games.append(game)
+        self.ticks.append(tick)
+        if len(self.frames) >= self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        path = os.path.join(self.directory, f'frames-{self.chunks:05d}.npz')
+        self.save(path, frames=np.stack(self.frames), games=np.array(self.games, dtype=np.int32),
+                  ticks=np.array(self.ticks, dtype=np.int32))
+        self.frames, self.games, self.ticks = [], [], []
+        self.chunks += 1
+
+    def close(self):
+        if self.frames:
+            self.flush()
+
+
+class PipeSink:
+    # Raw RGB frames to the standard input of an encoder such as ffmpeg.
+    # {width} and {height} in the command are filled in from the first frame.
+
+    def __init__(self, command):
+        self.command = command
+        self.process = None
+
+    def write(self, frame, game, tick):
+        if self.process is None:
+            height, width = frame.shape[:2]
+            self.process = subprocess.Popen(shlex.split(self.command.format(width=width, height=height)),
+                                            stdin=subprocess.PIPE)
+        self.process.stdin.write(frame.data)
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+class FrameWriter:
+    # Hands frames to a sink on a background thread through a bounded
+    # queue. submit() does not wait: while the queue is full, frames are
+    # dropped and counted, so a slow disk or encoder costs frames rather
+    # than simulation time. With wait=True it waits for room instead and
+    # keeps every frame. submit() copies the frame, and only when it will
+    # be written, so it may be given a view of a surface in use.
+    # convert(frame), if given, runs on the writer thread.
+
+    def __init__(self, sink, max_frames=QUEUE_FRAMES, convert=None, wait=False, name='FrameWriter'):
+        self.sink = sink
+        self.convert = convert
+        self.wait = wait
+        self.frames = queue.Queue(max_frames)
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, view, game, tick):
+        # The writer keeps taking frames out even after an error, so put()
+        # always returns
+        if self.error is not None or (not self.wait and self.frames.full()):
+            self.dropped += 1
+            return False
+        self.frames.put((np.array(view), game, tick))
+        return True
+
+    def close(self):
+        self.frames.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue
+            frame, game, tick = item
+            try:
+                if self.convert is not None:
+                    frame = self.convert(frame)
+                self.sink.write(frame, game, tick)
+                self.written += 1
+            except Exception as error:
+                # Keep draining, so that submit() and close() never block
+                self.error = error
+        try:
+            self.sink.close()
+        except Exception as error:
+            self.error = self.error or error
+
+
+def capture(games=1, width=20, height=20, seed=None, mode='rgb', step=1, sink=None, max_frames=QUEUE_FRAMES,
+            max_ticks=None, wait=False):
+    # Plays games with the autopilot as fast as they draw, one frame per
+    # tick. Returns the FrameWriter and the number of ticks played.
+    app.init_display()
+    game = app.MAIN(width, height, seed=seed)
+    game.set_autopilot(True)
+    if mode == 'grid':
+        writer = FrameWriter(sink or NpzSink(), max_frames, wait=wait)
+    else:
+        channels = rgb_channels(app.screen)
+        writer = FrameWriter(sink or NpzSink(), max_frames, lambda frame: to_rgb(frame, channels), wait)
+    ticks = 0
+    try:
+        for index in range(games):
+            game.reset_game()
+            game.snake.alpha = 1.0
+            while not game.game_over and (max_ticks is None or ticks < max_ticks):
+                game.update()
+                ticks += 1
+                if mode == 'grid':
+                    writer.submit(grid_planes(game.engine), index, game.engine.steps)
+                else:
+                    game.draw_dirty()
+                    view = pixel_view(app.screen, step)
+                    writer.submit(view, index, game.engine.steps)
+                    del view
+    finally:
+        writer.close()
+    return writer, ticks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record autopilot games offscreen as NumPy frames or video")
+    parser.add_argument('--games', type=int, default=1)
+    parser.add_argument('--board', type=app.board_size, default=(app.cell_number, app.cell_number),
+                        metavar='WIDTHxHEIGHT')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--mode', choices=('rgb', 'grid'), default='rgb',
+                        help="rgb: the window as drawn; grid: snake, head and fruit planes, one cell per pixel")
+    parser.add_argument('--step', type=int, default=1, help="keep every STEP-th pixel of rgb frames each way")
+    parser.add_argument('--output', default=CAPTURE_DIRECTORY, help="directory for the .npz chunks")
+    parser.add_argument('--chunk', type=int, default=CHUNK_FRAMES, help="frames per .npz file")
+    parser.add_argument('--compress', action='store_true', help="compress the .npz chunks")
+    parser.add_argument('--pipe', metavar='COMMAND',
+                        help="write raw rgb24 frames to COMMAND instead, e.g. "
+                             "'ffmpeg -y -f rawvideo -pix_fmt rgb24 -s {width}x{height} -r 30 -i - out.mp4'")
+    parser.add_argument('--queue', type=int, default=QUEUE_FRAMES, help="frames waiting for the writer at most")
+    parser.add_argument('--wait-for-writer', action='store_true',
+                        help="keep every frame by pausing the games while the writer is behind")
+    parser.add_argument('--max-ticks', type=int, help="stop after this many ticks in all")
+    parser.add_argument('--log-level', default='warning', choices=('debug', 'info', 'warning', 'error'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+    if args.pipe and args.mode == 'grid':
+        parser.error("--pipe takes rgb frames only")
+    if args.step < 1:
+        parser.error("--step must be at least 1")
+
+    sink = PipeSink(args.pipe) if args.pipe else NpzSink(args.output, args.chunk, args.compress)
+    started = time.perf_counter()
+    try:
+        writer, ticks = capture(args.games, *args.board, args.seed, args.mode, args.step, sink, args.queue,
+                                args.max_ticks, args.wait_for_writer)
+    except Exception as error:
+        log.error("Capture failed: %s", error)
+        return 1
+    elapsed = time.perf_counter() - started
+    print(f"{ticks} ticks in {elapsed:.1f} s ({ticks / elapsed:,.0f} per second), "
+          f"{writer.written} frames written, {writer.dropped} dropped")
+    if writer.dropped:
+        log.warning("The writer fell behind and %d frames were dropped; raise --queue, use --mode grid or "
+                    "--step, or pass --wait-for-writer to keep every frame", writer.dropped)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import logging
+import queue
+import random
+import socket
+import sys
+import threading
+import time
+
+import pygame
+
+from board_colors import MAX_WINDOW, MAX_CELL_SIZE, GRASS_COLORS, FRUIT_COLOR, snake_color
+from engine import DIRECTIONS, OPPOSITE, step_direction
+from keys import KEY_DIRECTIONS
+from protocol import (FRAME, SNAPSHOT, TICK, EMPTY, FRUIT, BoardMirror, decode_delta, decode_welcome,
+                      encode_input)
+from server import DEFAULT_PORT
+from stats import percentile
+from text_cache import get_font
+from world import START_LENGTH
+
+log = logging.getLogger(__name__)
+
+OWN_COLOR = (70, 70, 200)
+
+
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    if not host:
+        return value, DEFAULT_PORT
+    return host, int(port)
+
+
+class Connection:
+    # A blocking socket read on a background thread, so the pygame loop only
+    # ever drains a queue. None in the queue means the server went away.
+
+    def __init__(self, host, port):
+        self.socket = socket.create_connection((host, port))
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.messages = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.run, name='Connection', daemon=True)
+        self.thread.start()
+
+    def run(self):
+        stream = self.socket.makefile('rb')
+        try:
+            while True:
+                header = stream.read(FRAME.size)
+                if len(header) < FRAME.size:
+                    break
+                length, = FRAME.unpack(header)
+                payload = stream.read(length)
+                if len(payload) < length:
+                    break
+                self.messages.put(payload)
+        except OSError:
+            pass
+        self.messages.put(None)
+
+    def send(self, direction):
+        self.socket.sendall(encode_input(direction))
+
+    def close(self):
+        self.socket.close()
+
+
+class BoardView:
+    # The board drawn once and then patched with the paint operations of
+    # each delta, so a tick redraws only the cells that changed
+
+    def __init__(self, mirror, cell_size, own_id):
+        self.mirror = mirror
+        self.cell_size = cell_size
+        self.own_id = own_id
+        self.surface = pygame.Surface((mirror.width * cell_size, mirror.height * cell_size))
+        self.colors = {}
+
+    def color(self, snake_id):
+        if snake_id == self.own_id:
+            return OWN_COLOR
+        color = self.colors.get(snake_id)
+        if color is None:
+            color = self.colors[snake_id] = snake_color(snake_id)
+        return color
+
+    def paint(self, ops):
+        width = self.mirror.width
+        size = self.cell_size
+        surface = self.surface
+        for cell, value in ops:
+            x, y = cell % width, cell // width
+            rect = (x * size, y * size, size, size)
+            if value == EMPTY:
+                surface.fill(GRASS_COLORS[(x + y) % 2], rect)
+            elif value == FRUIT:
+                surface.fill(GRASS_COLORS[(x + y) % 2], rect)
+                pygame.draw.ellipse(surface, FRUIT_COLOR, rect)
+            else:
+                surface.fill(self.color(value), rect)
+
+    def repaint(self):
+        mirror = self.mirror
+        ops = [(cell, EMPTY) for cell in range(mirror.width * mirror.height)]
+        ops.extend((cell, FRUIT) for cell in mirror.fruits)
+        for snake_id, body in mirror.bodies.items():
+            ops.extend((cell, snake_id) for cell in body)
+        self.paint(ops)
+
+
+def run_client(address):
+    host, port = parse_address(address)
+    try:
+        connection = Connection(host, port)
+    except OSError as error:
+        log.error("Could not connect to %s:%d: %s", host, port, error)
+        return 1
+    welcome = connection.messages.get()
+    if welcome is None:
+        log.error("%s:%d closed the connection", host, port)
+        return 1
+    own_id, width, height, tick_ms = decode_welcome(welcome)
+
+    pygame.display.init()
+    pygame.font.init()
+    cell_size = max(2, min(MAX_CELL_SIZE, MAX_WINDOW // max(width, height)))
+    screen = pygame.display.set_mode((width * cell_size, height * cell_size))
+    pygame.display.set_caption(f'Snake Game - {host}:{port}')
+    clock = pygame.time.Clock()
+    font = get_font(20)
+
+    mirror = BoardMirror(width, height)
+    view = BoardView(mirror, cell_size, own_id)
+    synced = False
+
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                connection.close()
+                pygame.quit()
+                return 0
+            if event.type == pygame.KEYDOWN and event.key in KEY_DIRECTIONS:
+                # The server drops turns back into the neck
+                connection.send(KEY_DIRECTIONS[event.key])
+
+        while True:
+            try:
+                payload = connection.messages.get_nowait()
+            except queue.Empty:
+                break
+            if payload is None:
+                log.error("Lost the connection to %s:%d", host, port)
+                pygame.quit()
+                return 1
+            kind = payload[:1]
+            if kind == SNAPSHOT:
+                mirror.load_snapshot(payload)
+                view.repaint()
+                synced = True
+            elif kind == TICK and synced:
+                view.paint(mirror.apply(decode_delta(payload)))
+
+        screen.blit(view.surface, (0, 0))
+        body = mirror.bodies.get(own_id)
+        status = f"Score: {len(body) - START_LENGTH}" if body is not None else "Respawning..."
+        status += f"   Snakes: {len(mirror.bodies)}"
+        screen.blit(font.render(status, True, (56, 74, 12)), (10, 5))
+        pygame.display.flip()
+        clock.tick(60)
+
+
+def greedy_direction(mirror, body, rng):
+    # Toward the nearest fruit through a free neighbour, or any free cell
+    width, height = mirror.width, mirror.height
+    head = body[0]
+    x, y = head % width, head // width
+    heading = step_direction((body[1] % width, body[1] // width), (x, y)) if len(body) > 1 else None
+    target = min(mirror.fruits, key=lambda cell: abs(cell % width - x) + abs(cell // width - y), default=None)
+    best, best_distance = heading, None
+    directions = list(range(4))
+    rng.shuffle(directions)
+    for direction in directions:
+        if heading is not None and direction == OPPOSITE[heading]:
+            continue
+        dx, dy = DIRECTIONS[direction]
+        nx, ny = x + dx, y + dy
+        if not (0 <= nx < width and 0 <= ny < height) or mirror.occupancy[ny * width + nx]:
+            continue
+        distance = abs(target % width - nx) + abs(target // width - ny) if target is not None else 0
+        if best_distance is None or distance < best_distance:
+            best, best_distance = direction, distance
+    return best
+
+
+async def read_message(reader):
+    length, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(length)
+
+
+async def swarm(address, count, seconds, seed=None):
+    # count bots on count connections. Every bot reads its whole stream, as
+    # a real client would, but only the first one decodes it into the
+    # mirror that all of them steer by.
+    host, port = parse_address(address)
+    rng = random.Random(seed)
+    mirror = None
+    received = [0] * count
+    tick_gaps = []
+    deadline = time.perf_counter() + seconds
+
+    async def bot(index):
+        nonlocal mirror
+        reader, writer = await asyncio.open_connection(host, port)
+        own_id, width, height, tick_ms = decode_welcome(await read_message(reader))
+        if index == 0:
+            mirror = BoardMirror(width, height)
+        synced = False
+        last_tick = None
+        heading = None
+        try:
+            while time.perf_counter() < deadline:
+                payload = await read_message(reader)
+                received[index] += FRAME.size + len(payload)
+                kind = payload[:1]
+                if index == 0:
+                    if kind == SNAPSHOT:
+                        mirror.load_snapshot(payload)
+                        synced = True
+                    elif kind == TICK and synced:
+                        mirror.apply(decode_delta(payload))
+                    now = time.perf_counter()
+                    if last_tick is not None:
+                        tick_gaps.append(now - last_tick)
+                    last_tick = now
+                body = mirror.bodies.get(own_id) if mirror is not None else None
+                if body:
+                    direction = greedy_direction(mirror, body, rng)
+                    if direction is not None and direction != heading:
+                        writer.write(encode_input(direction))
+                        heading = direction
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(bot(index) for index in range(count)))
+    elapsed = time.perf_counter() - started
+    gaps = sorted(tick_gaps)
+    ticks = len(gaps) + 1
+    print(f"{count} bots for {elapsed:.1f} s: {ticks} ticks, "
+          f"{sum(received) / count / ticks:,.0f} bytes per client per tick, "
+          f"{sum(received) / elapsed / 1024:,.0f} KiB/s in total")
+    print(f"tick interval p50 {percentile(gaps, 0.5) * 1000:.1f} ms, p99 {percentile(gaps, 0.99) * 1000:.1f} ms, "
+          f"max {(gaps[-1] if gaps else 0) * 1000:.1f} ms")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Join a shared Snake board")
+    parser.add_argument('address', nargs='?', default=f'127.0.0.1:{DEFAULT_PORT}', metavar='HOST[:PORT]')
+    parser.add_argument('--swarm', type=int, metavar='N', help="connect N headless bots instead of opening a window")
+    parser.add_argument('--seconds', type=float, default=30.0, help="how long the swarm plays")
+    parser.add_argument('--log-level', default='warning', choices=('debug', 'info', 'warning', 'error'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+    if args.swarm:
+        return asyncio.run(swarm(args.address, args.swarm, args.seconds))
+    return run_client(args.address)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+import random
+import struct
+from array import array
+from collections import deque
+
+UP, RIGHT, DOWN, LEFT = 0, 1, 2, 3
+DIRECTIONS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+OPPOSITE = (DOWN, LEFT, UP, RIGHT)
+
+# Events reported by SnakeEngine.step
+EAT = 'eat'
+WALL = 'wall'
+SELF = 'self'
+WIN = 'win'
+
+NO_EVENTS = ()
+EAT_EVENTS = (EAT,)
+WIN_EVENTS = (EAT, WIN)
+
+SNAPSHOT_MAGIC = b'SNKE'
+SNAPSHOT_VERSION = 2
+# magic, version, width, height, fruit_count, has seed, seed bytes,
+# direction, new_block, done, cause, score, steps, head x, head y, body
+# length, fruits, free cells, has gauss_next, gauss_next. The seed follows
+# as a signed little-endian integer of any size.
+SNAPSHOT_HEADER = struct.Struct('<4sBHHHBHBBBBIIhhIHIBd')
+# The 624 Mersenne Twister words of random.Random plus its position
+RNG_STATE = struct.Struct('<625I')
+CAUSES = (None, WALL, SELF, WIN)
+
+
+def start_body(width, height):
+    x = min(5, width // 2)
+    y = height // 2
+    return [(x, y), (x - 1, y), (x - 2, y)]
+
+
+def step_direction(block, neighbour):
+    return DIRECTIONS.index((neighbour[0] - block[0], neighbour[1] - block[1]))
+
+
+class SnakeEngine:
+    # The game rules with no pygame dependency. app.py draws on top of this,
+    # bots and regression checks drive it directly through step().
+
+    def __init__(self, width=20, height=20, seed=None, fruit_count=1):
+        self.width = width
+        self.height = height
+        self.fruit_count = fruit_count
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.reset()
+
+    def reset(self, seed=None, body=None):
+        # body: connected cells, head first, to start from instead of the
+        # usual three-cell snake
+        if seed is not None:
+            self.seed = seed
+            self.rng.seed(seed)
+        # rng.getstate(), kept for clone() and snapshot() until the rng next
+        # draws
+        self.rng_state = None
+        cells = self.width * self.height
+        body = list(body or start_body(self.width, self.height))
+        self.body = deque(body)
+        # Number of body segments on each cell, indexed y * width + x.
+        # A count of 2 under the head means the snake ran into itself.
+        self.occupancy = bytearray(cells)
+        # Cells holding neither snake nor fruit. free_index maps a cell to its
+        # slot in `free` (-1 when taken) so both take and release are O(1).
+        self.free = array('i', range(cells))
+        self.free_index = array('i', range(cells))
+        # Tick at which the snake entered each cell. A segment's index in the
+        # body is its age, so steps - entered[cell] finds it without a scan.
+        self.entered = array('i', bytes(4 * cells))
+        # Orientation of the segment on each cell, packed as
+        # to_tail * 4 + to_head direction codes. Renderers read sprites from
+        # it; move_snake only has to touch the new head and the neck.
+        self.joints = bytearray(cells)
+        self.lay_body(body, 0)
+        for x, y in body:
+            self.take_cell(y * self.width + x)
+        self.fruits = []
+        self.direction = step_direction(body[1], body[0])
+        self.new_block = False
+        self.score = 0
+        self.steps = 0
+        self.done = False
+        self.cause = None
+        self.place_fruits(self.fruit_count)
+
+    def lay_body(self, body, steps, links=None):
+        # Fills occupancy, entered and joints for body, head first, as they
+        # stand on tick `steps`. links[i] is the direction from body[i] to
+        # body[i + 1], when known. Goes tail first, so that a head that ran
+        # into the body owns the cell as it does after move_snake.
+        if links is None:
+            links = [step_direction(body[index], body[index + 1]) for index in range(len(body) - 1)]
+        width, height = self.width, self.height
+        last = len(body) - 1
+        for index in range(last, -1, -1):
+            x, y = body[index]
+            if not (0 <= x < width and 0 <= y < height):
+                # A head that left the board
+                continue
+            cell = y * width + x
+            self.occupancy[cell] += 1
+            self.entered[cell] = steps - index
+            to_head = OPPOSITE[links[index - 1 if index else 0]]
+            to_tail = links[index] if index < last else OPPOSITE[to_head]
+            self.joints[cell] = to_tail * 4 + to_head
+
+    def clone(self):
+        # An independent copy to play ahead on. Everything mutable is a flat
+        # array, so this is a handful of memcpys; reading the
+        # RNG state costs about as much again, so it is only read once per
+        # fruit placed, however many clones are taken in between.
+        other = SnakeEngine.__new__(SnakeEngine)
+        other.__dict__.update(self.__dict__)
+        other.body = self.body.copy()
+        other.occupancy = self.occupancy[:]
+        other.free = self.free[:]
+        other.free_index = self.free_index[:]
+        other.entered = self.entered[:]
+        other.joints = self.joints[:]
+        other.fruits = self.fruits[:]
+        state = self.rng_state
+        if state is None:
+            state = self.rng_state = self.rng.getstate()
+        other.rng = random.Random.__new__(random.Random)
+        other.rng.setstate(state)
+        return other
+
+    def snapshot(self):
+        # The whole game as bytes, RNG included. The body is stored as its
+        # head plus a 2-bit step to each next segment, and the free cells in
+        # their current order, which decides where the next fruit lands.
+        body = self.body
+        width = self.width
+        cell_format = 'H' if width * self.height <= 0x10000 else 'I'
+        links = bytearray((len(body) + 2) // 4)
+        for index in range(len(body) - 1):
+            links[index >> 2] |= step_direction(body[index], body[index + 1]) << ((index & 3) * 2)
+        if self.rng_state is None:
+            self.rng_state = self.rng.getstate()
+        version, words, gauss_next = self.rng_state
+        head_x, head_y = body[0]
+        seed = self.seed or 0
+        seed = seed.to_bytes((seed.bit_length() + 8) // 8, 'little', signed=True)
+        return b''.join((
+            SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, width, self.height, self.fruit_count,
+                                 self.seed is not None, len(seed), self.direction, self.new_block,
+                                 self.done, CAUSES.index(self.cause), self.score, self.steps, head_x, head_y,
+                                 len(body), len(self.fruits), len(self.free),
+                                 gauss_next is not None, gauss_next or 0.0),
+            seed,
+            RNG_STATE.pack(*words),
+            bytes(links),
+            struct.pack(f'<{len(self.fruits)}{cell_format}', *(y * width + x for x, y in self.fruits)),
+            struct.pack(f'<{len(self.free)}{cell_format}', *self.free),
+        ))
+
+    def restore(self, data):
+        # Continues from a snapshot(), board size included
+        try:
+            (magic, version, width, height, fruit_count, has_seed, seed_size, direction, new_block, done, cause,
+             score, steps, head_x, head_y, length, fruit_total, free_total,
+             has_gauss, gauss_next) = SNAPSHOT_HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("snapshot is truncated")
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("not a snake game snapshot")
+        cells = width * height
+        cell_format = 'H' if cells <= 0x10000 else 'I'
+        offset = SNAPSHOT_HEADER.size
+        link_size = (length + 2) // 4
+        seed = int.from_bytes(data[offset:offset + seed_size], 'little', signed=True)
+        offset += seed_size
+        try:
+            words = RNG_STATE.unpack_from(data, offset)
+            offset += RNG_STATE.size
+            links = data[offset:offset + link_size]
+            offset += link_size
+            fruits = struct.unpack_from(f'<{fruit_total}{cell_format}', data, offset)
+            offset += struct.calcsize(f'<{fruit_total}{cell_format}')
+            free = array('i', struct.unpack_from(f'<{free_total}{cell_format}', data, offset))
+        except struct.error:
+            raise ValueError("snapshot is truncated")
+
+        links = [links[index >> 2] >> ((index & 3) * 2) & 3 for index in range(length - 1)]
+        x, y = head_x, head_y
+        body = [(x, y)]
+        for link in links:
+            dx, dy = DIRECTIONS[link]
+            x += dx
+            y += dy
+            body.append((x, y))
+
+        self.width = width
+        self.height = height
+        self.fruit_count = fruit_count
+        self.seed = seed if has_seed else None
+        self.rng_state = (3, words, gauss_next if has_gauss else None)
+        self.rng.setstate(self.rng_state)
+        self.body = deque(body)
+        self.occupancy = bytearray(cells)
+        self.entered = array('i', bytes(4 * cells))
+        self.joints = bytearray(cells)
+        self.lay_body(body, steps, links)
+        self.free = free
+        self.free_index = array('i', [-1]) * cells
+        for index, cell in enumerate(free):
+            self.free_index[cell] = index
+        self.fruits = [(cell % width, cell // width) for cell in fruits]
+        self.direction = direction
+        self.new_block = bool(new_block)
+        self.score = score
+        self.steps = steps
+        self.done = bool(done)
+        self.cause = CAUSES[cause]
+
+    @classmethod
+    def from_snapshot(cls, data):
+        engine = cls.__new__(cls)
+        engine.rng = random.Random.__new__(random.Random)
+        engine.restore(data)
+        return engine
+
+    def step(self, action=None):
+        if self.done:
+            return 0, True, NO_EVENTS
+        if action is not None and action != OPPOSITE[self.direction]:
+            self.direction = action
+
+        self.move_snake()
+        ate = self.check_collision()
+        cause = self.check_fail()
+
+        if cause is not None:
+            self.done = True
+            self.cause = cause
+            return -1, True, (EAT, cause) if ate else (cause,)
+        if ate:
+            if not self.free and not self.fruits:
+                # Nothing left to eat: the snake covers the whole board
+                self.done = True
+                self.cause = WIN
+                return 1, True, WIN_EVENTS
+            return 1, False, EAT_EVENTS
+        return 0, False, NO_EVENTS
+
+    def move_snake(self):
+        # take_cell/release_cell are inlined here, this runs every tick
+        body = self.body
+        occupancy = self.occupancy
+        free = self.free
+        free_index = self.free_index
+        width = self.width
+
+        x, y = body[0]
+        direction = self.direction
+        dx, dy = DIRECTIONS[direction]
+        joints = self.joints
+        neck = y * width + x
+        joints[neck] = joints[neck] & 12 | direction
+        x += dx
+        y += dy
+        if self.new_block:
+            self.new_block = False
+        else:
+            tail_x, tail_y = body.pop()
+            cell = tail_y * width + tail_x
+            occupancy[cell] -= 1
+            if not occupancy[cell]:
+                free_index[cell] = len(free)
+                free.append(cell)
+        body.appendleft((x, y))
+        self.steps += 1
+        if 0 <= x < width and 0 <= y < self.height:
+            cell = y * width + x
+            occupancy[cell] += 1
+            self.entered[cell] = self.steps
+            joints[cell] = OPPOSITE[direction] * 4 + direction
+            index = free_index[cell]
+            if index >= 0:
+                last = free.pop()
+                if last != cell:
+                    free[index] = last
+                    free_index[last] = index
+                free_index[cell] = -1
+
+    def check_collision(self):
+        head = self.body[0]
+        if head not in self.fruits:
+            return False
+        self.fruits.remove(head)
+        self.place_fruit()
+        self.new_block = True
+        self.score += 1
+        return True
+
+    def check_fail(self):
+        x, y = self.body[0]
+        if not 0 <= x < self.width or not 0 <= y < self.height:
+            return WALL
+        if self.occupancy[y * self.width + x] > 1:
+            return SELF
+        return None
+
+    def is_occupied(self, pos):
+        x, y = pos
+        return self.occupancy[y * self.width + x] > 0
+
+    def segment_index(self, pos):
+        # Index into body of the segment on pos, or None for an empty cell
+        x, y = pos
+        cell = y * self.width + x
+        if not self.occupancy[cell]:
+            return None
+        return self.steps - self.entered[cell]
+
+    def place_fruit(self):
+        # Uniform over the empty cells; None once the board is full
+        if not self.free:
+            return None
+        cell = self.free[self.rng.randrange(len(self.free))]
+        self.rng_state = None
+        self.take_cell(cell)
+        pos = (cell % self.width, cell // self.width)
+        self.fruits.append(pos)
+        return pos
+
+    def place_fruits(self, count):
+        return [pos for pos in (self.place_fruit() for _ in range(count)) if pos is not None]
+
+    def take_cell(self, cell):
+        index = self.free_index[cell]
+        last = self.free.pop()
+        if last != cell:
+            self.free[index] = last
+            self.free_index[last] = index
+        self.free_index[cell] = -1
+
+    def release_cell(self, cell):
+        self.free_index[cell] = len(self.free)
+        self.free.append(cell)
+
+    @property
+    def fruit(self):
+        return self.fruits[0] if self.fruits else None
+
+    @property
+    def head(self):
+        return self.body[0]
@@ -0,0 +1,235 @@
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+HIGH_SCORES_PATH = 'highscores.json'
+SCORES_DB_PATH = 'scores.db'
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+# Milliseconds per game tick on each difficulty
+TICK_MS = {"Easy": 200, "Medium": 150, "Hard": 100}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    difficulty TEXT NOT NULL,
+    player TEXT NOT NULL DEFAULT '',
+    score INTEGER NOT NULL,
+    length INTEGER,
+    duration REAL,
+    seed INTEGER,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_by_score ON runs (difficulty, score DESC);
+CREATE INDEX IF NOT EXISTS runs_by_player ON runs (player, difficulty, score DESC);
+
+-- Number of runs per score, kept next to runs so that percentile queries
+-- add up a few hundred rows instead of counting every run
+CREATE TABLE IF NOT EXISTS score_counts (
+    difficulty TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    runs INTEGER NOT NULL,
+    PRIMARY KEY (difficulty, score)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+INSERT_RUN = '''
+INSERT INTO runs (difficulty, player, score, length, duration, seed, finished_at)
+VALUES (:difficulty, :player, :score, :length, :duration, :seed, :finished_at)
+'''
+COUNT_RUN = '''
+INSERT INTO score_counts (difficulty, score, runs) VALUES (:difficulty, :score, 1)
+ON CONFLICT (difficulty, score) DO UPDATE SET runs = runs + 1
+'''
+
+
+def default_high_scores():
+    return {difficulty: 0 for difficulty in DIFFICULTIES}
+
+
+def load_high_scores(path=HIGH_SCORES_PATH):
+    # The old one-number-per-difficulty JSON file, read once for the import
+    high_scores = default_high_scores()
+    try:
+        with open(path, 'r') as f:
+            high_scores.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as error:
+        log.warning("Could not read %s: %s", path, error)
+    return high_scores
+
+
+class WriteBehind:
+    # Runs write(batch) on a background thread. submit() only queues the
+    # item, so the caller never waits on the disk; items queued while a
+    # write is running go out together in the next batch. Anything still
+    # queued is written when the interpreter exits.
+
+    def __init__(self, write, name='WriteBehind'):
+        self.write = write
+        self.pending = []
+        self.writing = False
+        self.closed = False
+        self.condition = threading.Condition()
+        self.name = name
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, item):
+        with self.condition:
+            self.pending.append(item)
+            self.condition.notify_all()
+
+    def flush(self):
+        with self.condition:
+            while self.pending or self.writing:
+                self.condition.wait()
+
+    def close(self):
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                batch, self.pending = self.pending, []
+                self.writing = True
+            try:
+                self.write(batch)
+            except Exception as error:
+                # Whatever went wrong, later items still get their turn
+                log.warning("%s could not save %d item(s): %s", self.name, len(batch), error)
+            finally:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+
+
+class ScoreStore:
+    # Every finished run, in SQLite. Inserts go through a WriteBehind thread
+    # with its own connection; queries use the connection of the thread that
+    # created the store. WAL mode lets the two run at the same time.
+
+    def __init__(self, path=SCORES_DB_PATH, import_path=HIGH_SCORES_PATH):
+        self.path = path
+        self.connection = self.connect()
+        with self.connection:
+            self.connection.executescript(SCHEMA)
+        self.import_high_scores(import_path)
+        self.write_connection = None
+        self.writer = WriteBehind(self.write_runs, name='ScoreStore')
+
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def import_high_scores(self, path):
+        # One-time import of the old highscores.json bests as runs
+        with self.connection:
+            if self.connection.execute("SELECT 1 FROM meta WHERE key = 'imported_json'").fetchone():
+                return
+            now = time.time()
+            runs = [{'difficulty': difficulty, 'player': '', 'score': score, 'length': None,
+                     'duration': None, 'seed': None, 'finished_at': now}
+                    for difficulty, score in load_high_scores(path).items() if score > 0]
+            self.connection.executemany(INSERT_RUN, runs)
+            self.connection.executemany(COUNT_RUN, runs)
+            self.connection.execute("INSERT INTO meta (key, value) VALUES ('imported_json', ?)", (path,))
+
+    def record_run(self, difficulty, score, length=None, duration=None, seed=None, player=''):
+        self.writer.submit({
+            'difficulty': difficulty,
+            'player': player,
+            'score': score,
+            'length': length,
+            'duration': duration,
+            'seed': seed,
+            'finished_at': time.time(),
+        })
+
+    def write_runs(self, runs):
+        if self.write_connection is None:
+            self.write_connection = self.connect()
+        try:
+            self.insert_runs(runs)
+        except Exception:
+            if len(runs) == 1:
+                raise
+            # The batch was rolled back. Insert the runs one at a time, so
+            # that one bad run does not cost the others theirs.
+            for run in runs:
+                try:
+                    self.insert_runs([run])
+                except Exception as error:
+                    log.warning("Could not save run %r: %s", run, error)
+
+    def insert_runs(self, runs):
+        with self.write_connection:
+            self.write_connection.executemany(INSERT_RUN, runs)
+            self.write_connection.executemany(COUNT_RUN, runs)
+
+    def flush(self):
+        self.writer.flush()
+
+    def best_scores(self):
+        high_scores = default_high_scores()
+        high_scores.update(self.connection.execute(
+            'SELECT difficulty, MAX(score) FROM score_counts GROUP BY difficulty'))
+        return high_scores
+
+    def top_runs(self, difficulty, limit=10):
+        return self.connection.execute(
+            'SELECT player, score, length, duration, seed, finished_at FROM runs '
+            'WHERE difficulty = ? ORDER BY score DESC LIMIT ?', (difficulty, limit)).fetchall()
+
+    def player_runs(self, player, difficulty, limit=10):
+        return self.connection.execute(
+            'SELECT score, length, duration, seed, finished_at FROM runs '
+            'WHERE player = ? AND difficulty = ? ORDER BY score DESC LIMIT ?',
+            (player, difficulty, limit)).fetchall()
+
+    def run_count(self, difficulty):
+        return self.connection.execute(
+            'SELECT COALESCE(SUM(runs), 0) FROM score_counts WHERE difficulty = ?', (difficulty,)).fetchone()[0]
+
+    def percentile(self, difficulty, score):
+        # Share of runs on difficulty that scored below score, from 0 to 100
+        below, total = self.connection.execute(
+            'SELECT COALESCE(SUM(CASE WHEN score < ? THEN runs END), 0), COALESCE(SUM(runs), 0) '
+            'FROM score_counts WHERE difficulty = ?', (score, difficulty)).fetchone()
+        return 100.0 * below / total if total else 0.0
+
+    def score_at_percentile(self, difficulty, percentile):
+        # Lowest score that at least percentile % of runs did not beat
+        total = self.run_count(difficulty)
+        if not total:
+            return None
+        wanted = total * percentile / 100.0
+        seen = 0
+        for score, runs in self.connection.execute(
+                'SELECT score, runs FROM score_counts WHERE difficulty = ? ORDER BY score', (difficulty,)):
+            seen += runs
+            if seen >= wanted:
+                return score
+        return score
@@ -0,0 +1,6 @@
+import pygame
+
+from engine import UP, RIGHT, DOWN, LEFT
+
+# Arrow keys to engine directions, for the local game and the network client
+KEY_DIRECTIONS = {pygame.K_UP: UP, pygame.K_RIGHT: RIGHT, pygame.K_DOWN: DOWN, pygame.K_LEFT: LEFT}
@@ -0,0 +1,153 @@
+import csv
+import json
+import statistics
+import time
+from array import array
+
+import pygame
+
+from stats import percentile
+from text_cache import get_font
+
+# Parts of a frame, in the order the main loop runs them
+PHASES = ('events', 'update', 'draw', 'modals', 'display', 'wait')
+FRAME_HISTORY = 600
+
+
+class FrameProfiler:
+    # Per-phase frame timings in fixed-size ring buffers. Recording a frame
+    # only writes floats into preallocated arrays; the statistics are worked
+    # out when something asks for them.
+
+    def __init__(self, size=FRAME_HISTORY):
+        self.size = size
+        self.frames = 0
+        self.started = array('d', bytes(8 * size))
+        self.phases = {phase: array('d', bytes(8 * size)) for phase in PHASES}
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.ticks = 0
+        # How long after its scheduled time each game tick actually ran
+        self.tick_lateness = array('d', bytes(8 * size))
+        self.inputs = 0
+        # From a key press being read by the main loop to the first frame
+        # showing its effect; the wait in SDL's event queue before the read
+        # is not included
+        self.input_latency = array('d', bytes(8 * size))
+        self.frame_start = self.last = time.perf_counter()
+
+    def start_frame(self):
+        self.frame_start = self.last = time.perf_counter()
+
+    def mark(self, phase):
+        # Charges the time since the previous mark to phase
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end_frame(self):
+        slot = self.frames % self.size
+        self.started[slot] = self.frame_start
+        current = self.current
+        for phase, column in self.phases.items():
+            column[slot] = current[phase]
+            current[phase] = 0.0
+        self.frames += 1
+
+    def record_tick(self, lateness):
+        self.tick_lateness[self.ticks % self.size] = lateness
+        self.ticks += 1
+
+    def record_input(self, latency):
+        self.input_latency[self.inputs % self.size] = latency
+        self.inputs += 1
+
+    def slots(self):
+        # Ring buffer slots from the oldest recorded frame to the newest
+        count = min(self.frames, self.size)
+        first = self.frames - count
+        return [(first + index) % self.size for index in range(count)]
+
+    def frame_times(self):
+        return [sum(column[slot] for column in self.phases.values()) for slot in self.slots()]
+
+    def stats(self):
+        slots = self.slots()
+        times = sorted(self.frame_times())
+        elapsed = self.started[slots[-1]] - self.started[slots[0]] if len(slots) > 1 else 0.0
+        lateness = self.tick_lateness[:min(self.ticks, self.size)]
+        latency = sorted(self.input_latency[:min(self.inputs, self.size)])
+        return {
+            'fps': (len(slots) - 1) / elapsed if elapsed > 0 else 0.0,
+            'p50': percentile(times, 0.50),
+            'p99': percentile(times, 0.99),
+            'tick_jitter': statistics.pstdev(lateness) if len(lateness) > 1 else 0.0,
+            'input_p50': percentile(latency, 0.50),
+            'input_p99': percentile(latency, 0.99),
+            'phases': {phase: statistics.fmean([column[slot] for slot in slots]) if slots else 0.0
+                       for phase, column in self.phases.items()},
+        }
+
+    def rows(self):
+        for slot in self.slots():
+            row = {'start': self.started[slot]}
+            row.update((phase, column[slot]) for phase, column in self.phases.items())
+            yield row
+
+    def export(self, path):
+        # CSV or JSON by the file extension; times are in seconds
+        rows = list(self.rows())
+        with open(path, 'w', newline='') as f:
+            if path.endswith('.json'):
+                json.dump({'phases': PHASES, 'stats': self.stats(), 'frames': rows}, f, indent=1)
+            else:
+                writer = csv.DictWriter(f, fieldnames=('start',) + PHASES)
+                writer.writeheader()
+                writer.writerows(rows)
+        return len(rows)
+
+
+class ProfilerOverlay:
+    # Statistics panel in the top left corner. The panel is opaque, never
+    # shrinks, and is only re-rendered a few times a second, so blitting it
+    # over every frame leaves nothing stale behind.
+    REFRESH = 0.5
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.visible = False
+        self.panel = None
+        self.width = 0
+        self.refreshed = 0.0
+
+    def toggle(self):
+        self.visible = not self.visible
+        self.panel = None
+
+    def draw(self, surface):
+        now = time.perf_counter()
+        if self.panel is None or now - self.refreshed >= self.REFRESH:
+            self.panel = self.render()
+            self.refreshed = now
+        return surface.blit(self.panel, (8, 8))
+
+    def render(self):
+        stats = self.profiler.stats()
+        lines = [
+            f"FPS {stats['fps']:.1f}",
+            f"frame p50 {stats['p50'] * 1000:.2f} ms  p99 {stats['p99'] * 1000:.2f} ms",
+            f"tick jitter {stats['tick_jitter'] * 1000:.2f} ms",
+            f"key read to frame p50 {stats['input_p50'] * 1000:.1f} ms  p99 {stats['input_p99'] * 1000:.1f} ms",
+        ]
+        lines += [f"{phase:<8} {mean * 1000:.2f} ms" for phase, mean in stats['phases'].items()]
+
+        # Numbers change every refresh; render directly instead of filling
+        # the shared text cache with them
+        font = get_font(16, None)
+        surfaces = [font.render(line, True, (230, 230, 230)) for line in lines]
+        line_height = font.get_linesize()
+        self.width = max(self.width, max(s.get_width() for s in surfaces) + 12)
+        panel = pygame.Surface((self.width, line_height * len(surfaces) + 8))
+        panel.fill((20, 20, 20))
+        for index, line_surface in enumerate(surfaces):
+            panel.blit(line_surface, (6, 4 + index * line_height))
+        return panel
@@ -0,0 +1,201 @@
+import struct
+from collections import deque
+
+from engine import DIRECTIONS, WALL, SELF
+from world import Delta, BODY, HEAD_ON
+
+# Every message is a 4-byte little-endian length followed by the payload,
+# whose first byte is its type. Cells and snake ids are 16-bit, so boards
+# are limited to MAX_CELLS.
+FRAME = struct.Struct('<I')
+MAX_CELLS = 0xFFFF
+
+WELCOME = b'W'
+SNAPSHOT = b'S'
+TICK = b'T'
+INPUT = b'D'
+
+# type, your snake id, width, height, tick length in ms
+WELCOME_HEADER = struct.Struct('<cHHHH')
+# type, tick, snakes, fruits
+SNAPSHOT_HEADER = struct.Struct('<cIHH')
+# type, tick, spawns, moves, grew, deaths, fruit removed, fruit added
+TICK_HEADER = struct.Struct('<cIHHHHHH')
+SNAKE_HEADER = struct.Struct('<HH')
+INPUT_MESSAGE = struct.Struct('<cB')
+# Clients only ever send inputs; anything longer is a protocol error
+MAX_CLIENT_MESSAGE = 16
+
+CAUSES = (None, WALL, BODY, HEAD_ON, SELF)
+
+# Values of the paint operations returned by BoardMirror.apply
+EMPTY = -1
+FRUIT = -2
+
+
+def frame(payload):
+    return FRAME.pack(len(payload)) + payload
+
+
+def pack_u16(values):
+    return struct.pack(f'<{len(values)}H', *values)
+
+
+def unpack_u16(data, offset, count):
+    return struct.unpack_from(f'<{count}H', data, offset), offset + 2 * count
+
+
+def pack_directions(directions):
+    # Four 2-bit direction codes to a byte, as in replays
+    packed = bytearray((len(directions) + 3) // 4)
+    for index, direction in enumerate(directions):
+        packed[index >> 2] |= direction << ((index & 3) * 2)
+    return bytes(packed)
+
+
+def unpack_directions(data, offset, count):
+    size = (count + 3) // 4
+    packed = data[offset:offset + size]
+    return [packed[index >> 2] >> ((index & 3) * 2) & 3 for index in range(count)], offset + size
+
+
+def encode_welcome(snake_id, width, height, tick_ms):
+    return frame(WELCOME_HEADER.pack(WELCOME, snake_id, width, height, tick_ms))
+
+
+def encode_snapshot(world):
+    parts = [SNAPSHOT_HEADER.pack(SNAPSHOT, world.tick, len(world.snakes), len(world.fruits))]
+    for snake in world.snakes.values():
+        parts.append(SNAKE_HEADER.pack(snake.id, len(snake.body)))
+        parts.append(pack_u16(snake.body))
+    parts.append(pack_u16(list(world.fruits)))
+    return frame(b''.join(parts))
+
+
+def encode_delta(delta):
+    parts = [TICK_HEADER.pack(TICK, delta.tick, len(delta.spawns), len(delta.moves), len(delta.grew),
+                              len(delta.deaths), len(delta.fruit_removed), len(delta.fruit_added))]
+    for snake_id, cells in delta.spawns:
+        parts.append(SNAKE_HEADER.pack(snake_id, len(cells)))
+        parts.append(pack_u16(cells))
+    parts.append(pack_u16([snake_id for snake_id, direction in delta.moves]))
+    parts.append(pack_directions([direction for snake_id, direction in delta.moves]))
+    parts.append(pack_u16(delta.grew))
+    parts.append(pack_u16([snake_id for snake_id, cause in delta.deaths]))
+    parts.append(bytes(CAUSES.index(cause) for snake_id, cause in delta.deaths))
+    parts.append(pack_u16(delta.fruit_removed))
+    parts.append(pack_u16(delta.fruit_added))
+    return frame(b''.join(parts))
+
+
+def encode_input(direction):
+    return frame(INPUT_MESSAGE.pack(INPUT, direction))
+
+
+def decode_snakes(data, offset, count):
+    snakes = []
+    for _ in range(count):
+        snake_id, length = SNAKE_HEADER.unpack_from(data, offset)
+        cells, offset = unpack_u16(data, offset + SNAKE_HEADER.size, length)
+        snakes.append((snake_id, cells))
+    return snakes, offset
+
+
+def decode_welcome(payload):
+    # (snake id, width, height, tick_ms)
+    return WELCOME_HEADER.unpack(payload)[1:]
+
+
+def decode_snapshot(payload):
+    # (tick, [(snake id, cells)], fruit cells)
+    kind, tick, snake_count, fruit_count = SNAPSHOT_HEADER.unpack_from(payload)
+    snakes, offset = decode_snakes(payload, SNAPSHOT_HEADER.size, snake_count)
+    fruits, offset = unpack_u16(payload, offset, fruit_count)
+    return tick, snakes, fruits
+
+
+def decode_delta(payload):
+    kind, tick, spawns, moves, grew, deaths, removed, added = TICK_HEADER.unpack_from(payload)
+    delta = Delta(tick)
+    delta.spawns, offset = decode_snakes(payload, TICK_HEADER.size, spawns)
+    ids, offset = unpack_u16(payload, offset, moves)
+    directions, offset = unpack_directions(payload, offset, moves)
+    delta.moves = list(zip(ids, directions))
+    delta.grew, offset = unpack_u16(payload, offset, grew)
+    ids, offset = unpack_u16(payload, offset, deaths)
+    delta.deaths = [(snake_id, CAUSES[code]) for snake_id, code in zip(ids, payload[offset:offset + deaths])]
+    offset += deaths
+    delta.fruit_removed, offset = unpack_u16(payload, offset, removed)
+    delta.fruit_added, offset = unpack_u16(payload, offset, added)
+    return delta
+
+
+def decode_input(payload):
+    # The direction, or None for anything that is not a valid input
+    if len(payload) != INPUT_MESSAGE.size:
+        return None
+    kind, direction = INPUT_MESSAGE.unpack(payload)
+    return direction if kind == INPUT and direction < 4 else None
+
+
+class BoardMirror:
+    # A client's copy of the board, rebuilt from a snapshot and kept up to
+    # date with deltas. It holds no rules: the server has already decided
+    # everything, the mirror only replays the changes.
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.load([], [], 0)
+
+    def load(self, snakes, fruits, tick):
+        self.tick = tick
+        self.bodies = {snake_id: deque(cells) for snake_id, cells in snakes}
+        self.fruits = set(fruits)
+        self.occupancy = bytearray(self.width * self.height)
+        for body in self.bodies.values():
+            for cell in body:
+                self.occupancy[cell] += 1
+
+    def load_snapshot(self, payload):
+        tick, snakes, fruits = decode_snapshot(payload)
+        self.load(snakes, fruits, tick)
+
+    def apply(self, delta):
+        # Returns (cell, value) paint operations in the order they happened;
+        # value is a snake id, EMPTY or FRUIT
+        ops = []
+        width = self.width
+        bodies = self.bodies
+        occupancy = self.occupancy
+        for snake_id, cells in delta.spawns:
+            bodies[snake_id] = deque(cells)
+            for cell in cells:
+                occupancy[cell] += 1
+                ops.append((cell, snake_id))
+        grew = set(delta.grew)
+        for snake_id, direction in delta.moves:
+            if snake_id not in grew:
+                cell = bodies[snake_id].pop()
+                occupancy[cell] -= 1
+                ops.append((cell, EMPTY))
+        for snake_id, cause in delta.deaths:
+            for cell in bodies.pop(snake_id, ()):
+                occupancy[cell] -= 1
+                ops.append((cell, EMPTY))
+        for cell in delta.fruit_removed:
+            self.fruits.discard(cell)
+            ops.append((cell, EMPTY))
+        for snake_id, direction in delta.moves:
+            body = bodies[snake_id]
+            dx, dy = DIRECTIONS[direction]
+            head = body[0]
+            cell = (head // width + dy) * width + head % width + dx
+            body.appendleft(cell)
+            occupancy[cell] += 1
+            ops.append((cell, snake_id))
+        for cell in delta.fruit_added:
+            self.fruits.add(cell)
+            ops.append((cell, FRUIT))
+        self.tick = delta.tick
+        return ops
@@ -0,0 +1,137 @@
+import argparse
+import os
+import struct
+import sys
+import time
+
+from engine import SnakeEngine
+
+MAGIC = b'SNKR'
+VERSION = 1
+# magic, version, width, height, fruit_count, seed, tick_ms, ticks, score
+HEADER = struct.Struct('<4sBHHHQHII')
+# Seeds have to fit both the 64-bit replay header and the signed 64-bit
+# seed column of the score database
+MAX_SEED = 2 ** 63 - 1
+REPLAY_DIRECTORY = 'replays'
+
+
+class Replay:
+    # A game is fully determined by its board, seed and the direction the
+    # snake moved on each tick. Directions are packed four to a byte.
+
+    def __init__(self, width, height, fruit_count, seed, tick_ms, ticks=0, score=0, moves=None):
+        self.width = width
+        self.height = height
+        self.fruit_count = fruit_count
+        self.seed = seed
+        self.tick_ms = tick_ms
+        self.ticks = ticks
+        self.score = score
+        self.moves = bytearray() if moves is None else moves
+
+    @classmethod
+    def for_engine(cls, engine, tick_ms):
+        return cls(engine.width, engine.height, engine.fruit_count, engine.seed, tick_ms)
+
+    def record(self, direction):
+        shift = (self.ticks & 3) * 2
+        if not shift:
+            self.moves.append(direction)
+        else:
+            self.moves[-1] |= direction << shift
+        self.ticks += 1
+
+    def direction(self, tick):
+        return self.moves[tick >> 2] >> ((tick & 3) * 2) & 3
+
+    def new_engine(self):
+        return SnakeEngine(self.width, self.height, seed=self.seed, fruit_count=self.fruit_count)
+
+    def to_bytes(self):
+        return HEADER.pack(MAGIC, VERSION, self.width, self.height, self.fruit_count, self.seed,
+                           round(self.tick_ms), self.ticks, self.score) + bytes(self.moves)
+
+    @classmethod
+    def from_bytes(cls, data):
+        try:
+            magic, version, width, height, fruit_count, seed, tick_ms, ticks, score = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("replay is truncated")
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a snake replay file")
+        if seed > MAX_SEED:
+            raise ValueError("replay seed is out of range")
+        moves = bytearray(data[HEADER.size:])
+        if len(moves) != (ticks + 3) // 4:
+            raise ValueError("replay file is truncated")
+        return cls(width, height, fruit_count, seed, tick_ms, ticks, score, moves)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+
+def replay_path(difficulty, replay, directory=REPLAY_DIRECTORY):
+    return os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{difficulty}-{replay.score}-{replay.seed}.snkr")
+
+
+def write_replays(batch):
+    for path, replay in batch:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        replay.save(path)
+
+
+def play_headless(replay):
+    # Runs the recorded game with no display, as fast as the engine goes
+    engine = replay.new_engine()
+    for tick in range(replay.ticks):
+        engine.step(replay.direction(tick))
+        if engine.done:
+            break
+    return engine
+
+
+def verify(paths):
+    failures = 0
+    for path in paths:
+        try:
+            replay = Replay.load(path)
+        except (OSError, ValueError) as error:
+            failures += 1
+            print(f"UNREADABLE {path}: {error}")
+            continue
+        started = time.perf_counter()
+        engine = play_headless(replay)
+        elapsed = time.perf_counter() - started
+        ok = engine.score == replay.score and engine.steps == replay.ticks
+        failures += not ok
+        print(f"{'OK' if ok else 'MISMATCH'} {path}: recorded score {replay.score}, replayed {engine.score} "
+              f"in {engine.steps} ticks ({engine.steps / max(elapsed, 1e-9):,.0f} ticks/s)")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check or watch recorded Snake games")
+    commands = parser.add_subparsers(dest='command', required=True)
+    verify_parser = commands.add_parser('verify', help="replay games headless and check their final scores")
+    verify_parser.add_argument('paths', nargs='+')
+    play_parser = commands.add_parser('play', help="watch a game in the window")
+    play_parser.add_argument('path')
+    play_parser.add_argument('--speed', type=int, default=1, help="playback speed, 1 to 64")
+    args = parser.parse_args(argv)
+
+    if args.command == 'verify':
+        return 1 if verify(args.paths) else 0
+
+    import app
+    app.main(['--replay', args.path, '--speed', str(args.speed)])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
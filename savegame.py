@@ -0,0 +1,75 @@
+import os
+import struct
+
+from engine import SnakeEngine
+from highscores import DIFFICULTIES
+from replay import Replay
+
+MAGIC = b'SNKS'
+VERSION = 1
+# magic, version, difficulty, assisted, seconds played, engine snapshot
+# length, recording length
+HEADER = struct.Struct('<4sBB?dII')
+SAVE_PATH = 'savegame.snks'
+
+
+class SavedGame:
+    # A game in progress: the engine snapshot, which carries the RNG, plus
+    # the replay recorded so far, so that the resumed game still ends up as
+    # one replay that plays back from its seed
+
+    def __init__(self, snapshot, recording, difficulty, elapsed=0.0, assisted=False):
+        self.snapshot = snapshot
+        self.recording = recording
+        self.difficulty = difficulty
+        self.elapsed = elapsed
+        self.assisted = assisted
+
+    def new_engine(self):
+        return SnakeEngine.from_snapshot(self.snapshot)
+
+    def to_bytes(self):
+        recording = self.recording.to_bytes()
+        return b''.join((
+            HEADER.pack(MAGIC, VERSION, DIFFICULTIES.index(self.difficulty), self.assisted, self.elapsed,
+                        len(self.snapshot), len(recording)),
+            self.snapshot,
+            recording,
+        ))
+
+    @classmethod
+    def from_bytes(cls, data):
+        try:
+            magic, version, difficulty, assisted, elapsed, snapshot_size, recording_size = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("save file is truncated")
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a snake save file")
+        if len(data) != HEADER.size + snapshot_size + recording_size or difficulty >= len(DIFFICULTIES):
+            raise ValueError("save file is damaged")
+        snapshot = data[HEADER.size:HEADER.size + snapshot_size]
+        recording = Replay.from_bytes(data[HEADER.size + snapshot_size:])
+        return cls(snapshot, recording, DIFFICULTIES[difficulty], elapsed, assisted)
+
+    def save(self, path=SAVE_PATH):
+        # Written next to the old save and then swapped in, so a crash or a
+        # full disk halfway through leaves the old save as it was
+        data = self.to_bytes()
+        temporary = path + '.tmp'
+        try:
+            with open(temporary, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+        except OSError:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path=SAVE_PATH):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
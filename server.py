@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from protocol import (FRAME, MAX_CELLS, MAX_CLIENT_MESSAGE, decode_input, encode_delta, encode_snapshot,
+                      encode_welcome)
+from stats import percentile
+from world import World, RESPAWN_TICKS
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PORT = 5555
+# A client with more than this many bytes not yet sent stops getting
+# deltas and gets a fresh snapshot once it has caught up
+MAX_CLIENT_BUFFER = 64 * 1024
+STATS_INTERVAL = 10.0
+
+
+class Client:
+    def __init__(self, snake_id, writer):
+        self.snake_id = snake_id
+        self.writer = writer
+        # Waiting for a snapshot: just joined, or fell behind
+        self.needs_snapshot = True
+        self.respawn_at = None
+
+
+class GameServer:
+    # Owns the World and its tick. Inputs only set the direction a snake
+    # takes on its next step; each tick the server steps the world, encodes
+    # the delta once and writes the same bytes to every client, so the work
+    # per tick is one step plus one write per client.
+
+    def __init__(self, width, height, tick_ms=100, fruit_count=50, seed=None):
+        if width * height > MAX_CELLS:
+            raise ValueError(f"boards are limited to {MAX_CELLS} cells")
+        self.world = World(width, height, seed=seed, fruit_count=fruit_count)
+        self.tick_ms = tick_ms
+        self.clients = {}
+        self.next_id = 0
+        self.tick_times = []
+        self.bytes_sent = 0
+        self.ticks_sent = 0
+
+    def new_snake_id(self):
+        while self.next_id in self.clients:
+            self.next_id = (self.next_id + 1) % 0x10000
+        snake_id = self.next_id
+        self.next_id = (self.next_id + 1) % 0x10000
+        return snake_id
+
+    async def handle_client(self, reader, writer):
+        snake_id = self.new_snake_id()
+        client = Client(snake_id, writer)
+        self.clients[snake_id] = client
+        world = self.world
+        if world.add_snake(snake_id) is None:
+            client.respawn_at = world.tick + RESPAWN_TICKS
+        writer.write(encode_welcome(snake_id, world.width, world.height, self.tick_ms))
+        log.info("Player %d joined from %s", snake_id, writer.get_extra_info('peername'))
+        try:
+            while True:
+                length, = FRAME.unpack(await reader.readexactly(FRAME.size))
+                if length > MAX_CLIENT_MESSAGE:
+                    log.warning("Player %d sent a %d-byte message, disconnecting", snake_id, length)
+                    break
+                direction = decode_input(await reader.readexactly(length))
+                if direction is not None:
+                    world.turn(snake_id, direction)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del self.clients[snake_id]
+            world.remove_snake(snake_id)
+            writer.close()
+            log.info("Player %d left", snake_id)
+
+    def tick(self):
+        world = self.world
+        for client in self.clients.values():
+            if client.respawn_at is not None and world.tick >= client.respawn_at:
+                if world.add_snake(client.snake_id) is not None:
+                    client.respawn_at = None
+                else:
+                    client.respawn_at = world.tick + RESPAWN_TICKS
+
+        delta = world.step()
+        for snake_id, cause in delta.deaths:
+            client = self.clients.get(snake_id)
+            if client is not None:
+                client.respawn_at = world.tick + RESPAWN_TICKS
+
+        message = encode_delta(delta)
+        snapshot = None
+        for client in self.clients.values():
+            transport = client.writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                # Too slow to keep up: skip deltas until the buffer drains
+                client.needs_snapshot = True
+                continue
+            if client.needs_snapshot:
+                # Encoded at most once per tick, however many clients need it
+                if snapshot is None:
+                    snapshot = encode_snapshot(world)
+                client.writer.write(snapshot)
+                client.needs_snapshot = False
+                self.bytes_sent += len(snapshot)
+            else:
+                client.writer.write(message)
+                self.bytes_sent += len(message)
+        self.ticks_sent += 1
+
+    def log_stats(self):
+        times = sorted(self.tick_times)
+        log.info("%d players, %d snakes, tick p50 %.2f ms p99 %.2f ms max %.2f ms, %.0f bytes sent per tick",
+                 len(self.clients), len(self.world.snakes), percentile(times, 0.5) * 1000,
+                 percentile(times, 0.99) * 1000, (times[-1] if times else 0.0) * 1000,
+                 self.bytes_sent / max(self.ticks_sent, 1))
+        self.tick_times.clear()
+        self.bytes_sent = self.ticks_sent = 0
+
+    async def run(self, host='127.0.0.1', port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        log.info("Serving a %dx%d board on %s:%d", self.world.width, self.world.height, host, port)
+        loop = asyncio.get_running_loop()
+        interval = self.tick_ms / 1000
+        next_tick = loop.time() + interval
+        next_stats = loop.time() + STATS_INTERVAL
+        async with server:
+            while True:
+                await asyncio.sleep(max(next_tick - loop.time(), 0))
+                started = time.perf_counter()
+                self.tick()
+                self.tick_times.append(time.perf_counter() - started)
+                next_tick += interval
+                if next_tick < loop.time():
+                    # Fell more than a tick behind: drop the missed ticks
+                    # rather than running them back to back
+                    next_tick = loop.time() + interval
+                if loop.time() >= next_stats:
+                    self.log_stats()
+                    next_stats += STATS_INTERVAL
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host a shared Snake board")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--board', default='64x64', metavar='WIDTHxHEIGHT')
+    parser.add_argument('--tick-ms', type=int, default=100)
+    parser.add_argument('--fruits', type=int, default=50)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--log-level', default='info', choices=('debug', 'info', 'warning', 'error'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s %(name)s: %(message)s')
+
+    try:
+        width, height = (int(part) for part in args.board.lower().split('x'))
+    except ValueError:
+        parser.error(f"expected WIDTHxHEIGHT, got {args.board!r}")
+    try:
+        server = GameServer(width, height, args.tick_ms, args.fruits, args.seed)
+    except ValueError as error:
+        parser.error(str(error))
+    try:
+        asyncio.run(server.run(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
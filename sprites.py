@@ -0,0 +1,123 @@
+import json
+import logging
+import os
+import struct
+
+import pygame
+
+from engine import UP, RIGHT, DOWN, LEFT
+
+log = logging.getLogger(__name__)
+
+SPRITE_NAMES = (
+    'head_up', 'head_down', 'head_right', 'head_left',
+    'tail_up', 'tail_down', 'tail_right', 'tail_left',
+    'body_vertical', 'body_horizontal', 'body_tr', 'body_tl', 'body_br', 'body_bl',
+    'apple',
+)
+
+# Decoded atlas pixels, so later starts skip the PNG decoding and packing
+ATLAS_CACHE_PATH = os.path.join('.asset_cache', 'atlas.bin')
+CACHE_MAGIC = b'SNKA'
+CACHE_VERSION = 1
+# magic, version, width, height, length of the JSON metadata
+CACHE_HEADER = struct.Struct('<4sBHHI')
+
+# Direction code of a one-cell step, indexed by (dx + 1) * 3 + dy + 1
+STEP_CODES = (None, LEFT, None, UP, None, DOWN, None, RIGHT, None)
+
+# Head and tail sprites by the direction from the end segment to its neighbour
+HEAD_SPRITES = ('head_down', 'head_left', 'head_up', 'head_right')
+TAIL_SPRITES = ('tail_down', 'tail_left', 'tail_up', 'tail_right')
+
+# Body sprites by [direction to the tail side][direction to the head side]
+JOINT_SPRITES = [[None] * 4 for _ in range(4)]
+for _a, _b, _name in ((UP, DOWN, 'body_vertical'), (LEFT, RIGHT, 'body_horizontal'),
+                      (LEFT, UP, 'body_tl'), (LEFT, DOWN, 'body_bl'),
+                      (RIGHT, UP, 'body_tr'), (RIGHT, DOWN, 'body_br')):
+    JOINT_SPRITES[_a][_b] = JOINT_SPRITES[_b][_a] = _name
+
+
+def step_code(block, neighbour):
+    return STEP_CODES[(neighbour[0] - block[0] + 1) * 3 + neighbour[1] - block[1] + 1]
+
+
+def load_atlas(directory='Graphics', cache_path=ATLAS_CACHE_PATH):
+    # Returns the atlas, not yet converted to the display format, and the
+    # area of each sprite in it. Touches no display state, so it can run on
+    # a background thread.
+    sources = sprite_sources(directory)
+    if cache_path:
+        cached = read_atlas_cache(cache_path, sources)
+        if cached is not None:
+            return cached
+    atlas, areas = pack_atlas(directory)
+    if cache_path:
+        try:
+            write_atlas_cache(cache_path, atlas, areas, sources)
+        except OSError as error:
+            log.warning("Could not write %s: %s", cache_path, error)
+    return atlas, areas
+
+
+def sprite_sources(directory):
+    # Size and modification time of every sprite file; a cached atlas is
+    # used only while these still match
+    sources = []
+    for name in SPRITE_NAMES:
+        stat = os.stat(f'{directory}/{name}.png')
+        sources.append([name, stat.st_mtime_ns, stat.st_size])
+    return sources
+
+
+def pack_atlas(directory):
+    # Packs every sprite into one surface side by side
+    images = [pygame.image.load(f'{directory}/{name}.png') for name in SPRITE_NAMES]
+    width = sum(image.get_width() for image in images)
+    height = max(image.get_height() for image in images)
+
+    atlas = pygame.Surface((width, height), pygame.SRCALPHA)
+    areas = {}
+    x = 0
+    for name, image in zip(SPRITE_NAMES, images):
+        # RGBA_MAX onto the transparent atlas copies the pixels unblended
+        atlas.blit(image, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+        areas[name] = pygame.Rect((x, 0), image.get_size())
+        x += image.get_width()
+    return atlas, areas
+
+
+def read_atlas_cache(path, sources):
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, width, height, meta_length = CACHE_HEADER.unpack_from(data)
+    except (OSError, struct.error):
+        return None
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    start = CACHE_HEADER.size
+    try:
+        meta = json.loads(data[start:start + meta_length])
+    except ValueError:
+        return None
+    if meta.get('sources') != sources:
+        return None
+    pixels = data[start + meta_length:]
+    if len(pixels) != width * height * 4:
+        return None
+    atlas = pygame.image.frombytes(pixels, (width, height), 'RGBA')
+    areas = {name: pygame.Rect(area) for name, area in meta['areas'].items()}
+    return atlas, areas
+
+
+def write_atlas_cache(path, atlas, areas, sources):
+    meta = json.dumps({'sources': sources, 'areas': {name: list(area) for name, area in areas.items()}}).encode()
+    width, height = atlas.get_size()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, width, height, len(meta)))
+        f.write(meta)
+        f.write(pygame.image.tobytes(atlas, 'RGBA'))
+    os.replace(temporary, path)
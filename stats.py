@@ -0,0 +1,9 @@
+# Small statistics helpers with no Pygame dependency, shared by the
+# profiler and the headless tools
+
+
+def percentile(values, fraction):
+    # values must be sorted
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from autopilot import Autopilot, hamiltonian_cycle
+from engine import DIRECTIONS, OPPOSITE, WIN, SnakeEngine
+
+
+def random_move(engine, rng):
+    # Any move that does not crash on this tick
+    x, y = engine.head
+    moves = [direction for direction, (dx, dy) in enumerate(DIRECTIONS)
+             if direction != OPPOSITE[engine.direction] and 0 <= x + dx < engine.width
+             and 0 <= y + dy < engine.height and not engine.is_occupied((x + dx, y + dy))]
+    return rng.choice(moves) if moves else None
+
+
+def test_hamiltonian_cycle():
+    for width, height in ((4, 4), (5, 4), (4, 5), (2, 7)):
+        tour = hamiltonian_cycle(width, height)
+        assert sorted(tour) == [(x, y) for x in range(width) for y in range(height)]
+        for (x, y), (next_x, next_y) in zip(tour, tour[1:] + tour[:1]):
+            assert abs(next_x - x) + abs(next_y - y) == 1
+    with pytest.raises(ValueError):
+        hamiltonian_cycle(5, 5)
+
+
+def test_wins_from_the_start():
+    engine = SnakeEngine(8, 6, seed=3)
+    autopilot = Autopilot(engine)
+    while not engine.done:
+        engine.step(autopilot.choose())
+    assert engine.cause == WIN
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_takes_over_a_game_in_progress(seed):
+    # The player steers for a while, then hands over. The autopilot has to
+    # find its way back to the tour without cutting itself off from its tail.
+    rng = random.Random(seed)
+    engine = SnakeEngine(12, 12, seed=seed)
+    autopilot = Autopilot(engine)
+    while len(engine.body) < 40:
+        engine.step(autopilot.choose())
+    for _ in range(rng.randrange(3, 12)):
+        engine.step(random_move(engine, rng))
+    x, y = engine.head
+    head = y * engine.width + x
+    if engine.done or not any(autopilot.room(cell)[0] for direction, cell in autopilot.cell_neighbours(head)
+                              if autopilot.vacant(cell)):
+        pytest.skip("the player already trapped the snake")
+    for _ in range(2000):
+        if engine.done:
+            break
+        engine.step(autopilot.choose())
+    assert engine.cause in (None, WIN)
@@ -0,0 +1,156 @@
+import pytest
+
+from engine import (DIRECTIONS, DOWN, EAT_EVENTS, LEFT, OPPOSITE, RIGHT, SELF, UP, WALL, WIN, WIN_EVENTS,
+                    SnakeEngine, start_body)
+
+
+def toward_fruit(engine):
+    # Heads for the fruit by the first safe move, which keeps a short snake
+    # alive for many fruits on an open board
+    (x, y), (fruit_x, fruit_y) = engine.head, engine.fruit
+    moves = sorted((UP, RIGHT, DOWN, LEFT), key=lambda move: abs(x + DIRECTIONS[move][0] - fruit_x)
+                   + abs(y + DIRECTIONS[move][1] - fruit_y))
+    for move in moves:
+        next_x, next_y = x + DIRECTIONS[move][0], y + DIRECTIONS[move][1]
+        if (move != OPPOSITE[engine.direction] and 0 <= next_x < engine.width and 0 <= next_y < engine.height
+                and not engine.is_occupied((next_x, next_y))):
+            return move
+    return None
+
+
+def play(engine, ticks):
+    # What happened on each tick, fruit included, for comparing two games
+    trace = []
+    for _ in range(ticks):
+        if engine.done:
+            break
+        reward, done, events = engine.step(toward_fruit(engine))
+        trace.append((reward, done, events, tuple(engine.body), tuple(engine.fruits)))
+    return trace
+
+
+def state(engine):
+    return (engine.width, engine.height, engine.seed, tuple(engine.body), engine.fruits, list(engine.free),
+            engine.direction, engine.new_block, engine.score, engine.steps, engine.done, engine.cause)
+
+
+def test_wall_collision():
+    engine = SnakeEngine(10, 10, seed=1)
+    engine.reset(body=[(0, 0), (1, 0), (2, 0)])
+    assert engine.direction == LEFT
+    assert engine.step() == (-1, True, (WALL,))
+    assert engine.done and engine.cause == WALL
+    # A finished game stays finished
+    assert engine.step(DOWN) == (0, True, ())
+
+
+def test_self_collision():
+    engine = SnakeEngine(10, 10, seed=1)
+    engine.reset(body=[(1, 1), (2, 1), (2, 2), (1, 2), (0, 2)])
+    reward, done, events = engine.step(DOWN)
+    assert (reward, done, events[-1]) == (-1, True, SELF)
+    assert engine.cause == SELF
+
+
+def test_reversing_is_ignored():
+    engine = SnakeEngine(10, 10, seed=1)
+    head_x, head_y = engine.head
+    engine.step(LEFT)
+    assert engine.direction == RIGHT
+    assert engine.head == (head_x + 1, head_y)
+
+
+def test_eating_grows_the_snake():
+    # On a single row every free cell is ahead of the snake
+    engine = SnakeEngine(10, 1, seed=3)
+    engine.reset(body=[(2, 0), (1, 0), (0, 0)])
+    events = ()
+    while events != EAT_EVENTS:
+        reward, done, events = engine.step()
+        assert not done
+    assert reward == 1 and engine.score == 1
+    assert len(engine.body) == 3
+    tail = engine.body[-1]
+    engine.step()
+    assert len(engine.body) == 4
+    assert engine.body[-1] == tail
+
+
+def test_win_on_full_board():
+    engine = SnakeEngine(2, 2, seed=1)
+    engine.reset(body=[(0, 0), (0, 1), (1, 1)])
+    assert engine.fruits == [(1, 0)]
+    assert engine.step(RIGHT) == (1, False, EAT_EVENTS)
+    assert engine.fruits == [(1, 1)]
+    assert engine.step(DOWN) == (1, True, WIN_EVENTS)
+    assert engine.cause == WIN
+    assert len(engine.body) == 4 and not engine.free
+
+
+def test_segment_index():
+    engine = SnakeEngine(10, 10, seed=5)
+    for index, pos in enumerate(engine.body):
+        assert engine.segment_index(pos) == index
+    play(engine, 40)
+    for index, pos in enumerate(engine.body):
+        assert engine.segment_index(pos) == index
+    empty = next((x, y) for y in range(10) for x in range(10) if not engine.is_occupied((x, y)))
+    assert engine.segment_index(empty) is None
+
+
+def test_start_body():
+    engine = SnakeEngine(20, 20)
+    assert list(engine.body) == start_body(20, 20)
+    assert engine.direction == RIGHT
+    assert len(engine.fruits) == 1 and engine.fruit not in engine.body
+
+
+@pytest.mark.parametrize('seed', [7, None, -3, 2 ** 70])
+def test_snapshot_round_trip(seed):
+    engine = SnakeEngine(12, 9, seed=seed, fruit_count=2)
+    play(engine, 25)
+    restored = SnakeEngine.from_snapshot(engine.snapshot())
+    assert state(restored) == state(engine)
+    assert restored.snapshot() == engine.snapshot()
+    assert play(restored, 200) == play(engine, 200)
+
+
+def test_snapshot_of_finished_game():
+    engine = SnakeEngine(10, 10, seed=1)
+    engine.reset(body=[(0, 0), (1, 0), (2, 0)])
+    engine.step()
+    restored = SnakeEngine.from_snapshot(engine.snapshot())
+    assert restored.done and restored.cause == WALL
+    assert state(restored) == state(engine)
+
+
+def test_restore_changes_board_size():
+    engine = SnakeEngine(30, 30, seed=2)
+    engine.restore(SnakeEngine(8, 6, seed=4).snapshot())
+    assert (engine.width, engine.height) == (8, 6)
+    assert play(engine, 50) == play(SnakeEngine(8, 6, seed=4), 50)
+
+
+def test_bad_snapshots():
+    data = SnakeEngine(10, 10, seed=1).snapshot()
+    with pytest.raises(ValueError):
+        SnakeEngine.from_snapshot(data[:20])
+    with pytest.raises(ValueError):
+        SnakeEngine.from_snapshot(data[:-10])
+    with pytest.raises(ValueError):
+        SnakeEngine.from_snapshot(b'XXXX' + data[4:])
+
+
+def test_clone_plays_on_identically():
+    engine = SnakeEngine(10, 10, seed=11)
+    play(engine, 15)
+    clone = engine.clone()
+    assert state(clone) == state(engine)
+    assert play(clone, 200) == play(engine.clone(), 200)
+
+
+def test_clone_is_independent():
+    engine = SnakeEngine(10, 10, seed=11)
+    before = state(engine)
+    play(engine.clone(), 30)
+    assert state(engine) == before
@@ -0,0 +1,22 @@
+from highscores import ScoreStore
+from replay import MAX_SEED
+
+
+def test_record_run_with_largest_seed(tmp_path):
+    store = ScoreStore(str(tmp_path / 'scores.db'), import_path=str(tmp_path / 'missing.json'))
+    store.record_run('Easy', 12, length=15, duration=3.5, seed=MAX_SEED, player='ann')
+    store.flush()
+    assert [run[:5] for run in store.top_runs('Easy')] == [('ann', 12, 15, 3.5, MAX_SEED)]
+    assert store.best_scores()['Easy'] == 12
+    store.writer.close()
+
+
+def test_bad_run_does_not_lose_the_batch(tmp_path):
+    store = ScoreStore(str(tmp_path / 'scores.db'), import_path=str(tmp_path / 'missing.json'))
+    runs = [{'difficulty': 'Hard', 'player': player, 'score': score, 'length': None, 'duration': None,
+             'seed': seed, 'finished_at': 0.0}
+            for player, score, seed in (('ann', 5, 1), ('bob', 9, 2 ** 64), ('cy', 7, 3))]
+    store.write_runs(runs)
+    assert [run[:2] for run in store.top_runs('Hard')] == [('cy', 7), ('ann', 5)]
+    assert store.run_count('Hard') == 2
+    store.writer.close()
@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from protocol import (EMPTY, FRAME, FRUIT, BoardMirror, decode_delta, decode_input, encode_delta, encode_input,
+                      encode_snapshot)
+from world import NO_OWNER, RESPAWN_TICKS, World
+
+
+def payload(message):
+    length, = FRAME.unpack_from(message)
+    assert len(message) == FRAME.size + length
+    return message[FRAME.size:]
+
+
+def expected_paint(world):
+    return [world.owner[cell] if world.owner[cell] != NO_OWNER else FRUIT if cell in world.fruits else EMPTY
+            for cell in range(world.width * world.height)]
+
+
+def check_mirror(mirror, world, paint):
+    assert mirror.tick == world.tick
+    assert mirror.bodies == {snake.id: snake.body for snake in world.snakes.values()}
+    assert mirror.fruits == world.fruits
+    assert list(mirror.occupancy) == [owner != NO_OWNER for owner in world.owner]
+    assert paint == expected_paint(world)
+
+
+def load(world):
+    mirror = BoardMirror(world.width, world.height)
+    mirror.load_snapshot(payload(encode_snapshot(world)))
+    return mirror, expected_paint(world)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_deltas_rebuild_the_server_board(seed):
+    # Snakes turn at random, die, respawn and leave between ticks, the way
+    # server.py drives the world; a mirror fed the encoded deltas, and one
+    # that joins halfway through, have to match the world after every tick
+    rng = random.Random(seed)
+    world = World(16, 12, seed=seed, fruit_count=6)
+    respawn_at = {}
+    for snake_id in range(8):
+        world.add_snake(snake_id)
+    world.step()
+    mirrors = [load(world)]
+    for _ in range(400):
+        for snake_id in range(8):
+            if snake_id in world.snakes:
+                if rng.random() < 0.3:
+                    world.turn(snake_id, rng.randrange(4))
+                if rng.random() < 0.005:
+                    # A player leaving; the id comes back later, as a new player
+                    world.remove_snake(snake_id)
+                    respawn_at[snake_id] = world.tick + RESPAWN_TICKS
+            if snake_id not in world.snakes and world.tick >= respawn_at.get(snake_id, 0):
+                world.add_snake(snake_id)
+        delta = world.step()
+        for snake_id, cause in delta.deaths:
+            respawn_at[snake_id] = world.tick + RESPAWN_TICKS
+        message = payload(encode_delta(delta))
+        for mirror, paint in mirrors:
+            for cell, value in mirror.apply(decode_delta(message)):
+                paint[cell] = value
+            check_mirror(mirror, world, paint)
+        if world.tick == 200:
+            mirrors.append(load(world))
+    assert len(mirrors) == 2
+
+
+def test_inputs():
+    for direction in range(4):
+        assert decode_input(payload(encode_input(direction))) == direction
+    assert decode_input(b'D\x04') is None
+    assert decode_input(b'X\x01') is None
+    assert decode_input(b'D\x01\x00') is None
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from engine import SnakeEngine
+from replay import Replay
+from savegame import SavedGame
+
+
+def saved_game(seed):
+    engine = SnakeEngine(12, 10, seed=seed)
+    recording = Replay.for_engine(engine, 150)
+    for _ in range(5):
+        engine.step()
+        recording.record(engine.direction)
+    return SavedGame(engine.snapshot(), recording, 'Medium', 4.5, assisted=False)
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'savegame.snks')
+    saved = saved_game(3)
+    saved.save(path)
+    loaded = SavedGame.load(path)
+    assert loaded.to_bytes() == saved.to_bytes()
+    assert loaded.new_engine().snapshot() == saved.snapshot
+    assert os.listdir(tmp_path) == ['savegame.snks']
+
+
+def test_failed_save_keeps_the_old_one(tmp_path, monkeypatch):
+    path = str(tmp_path / 'savegame.snks')
+    old = saved_game(3)
+    old.save(path)
+
+    def fail(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, 'fsync', fail)
+    with pytest.raises(OSError):
+        saved_game(4).save(path)
+    assert SavedGame.load(path).to_bytes() == old.to_bytes()
+    assert os.listdir(tmp_path) == ['savegame.snks']
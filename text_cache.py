@@ -0,0 +1,50 @@
+import pygame
+from collections import OrderedDict
+
+FONT_PATH = 'Font/PoetsenOne-Regular.ttf'
+
+_fonts = {}
+
+
+def get_font(size, path=FONT_PATH):
+    # One pygame Font per (path, size); opening the TTF is the expensive part
+    key = (path, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = _fonts[key] = pygame.font.Font(path, size)
+    return font
+
+
+class TextCache:
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, size, color, antialias=True, path=FONT_PATH):
+        key = (text, size, color, antialias, path)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.surfaces.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = get_font(size, path).render(text, antialias, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+text_cache = TextCache()
+
+
+def render_text(text, size, color, antialias=True, path=FONT_PATH):
+    return text_cache.render(text, size, color, antialias, path)
@@ -0,0 +1,240 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+
+from engine import SnakeEngine, DIRECTIONS, OPPOSITE, WALL, SELF, WIN
+from autopilot import Autopilot, hamiltonian_cycle
+from highscores import DIFFICULTIES, TICK_MS
+from stats import percentile
+
+TIMEOUT = 'timeout'
+# Episode end reasons by the code sent back from the workers
+CAUSES = (WALL, SELF, WIN, TIMEOUT)
+# Fields of one episode record, in the order they are packed
+FIELDS = ('seed', 'score', 'steps', 'cause', 'length')
+
+
+class RandomPolicy:
+    def __init__(self, engine):
+        self.engine = engine
+        self.rng = random.Random()
+
+    def reset(self):
+        self.rng.seed(self.engine.seed)
+
+    def choose(self):
+        return self.rng.randrange(4)
+
+
+class GreedyPolicy:
+    # Steps to the free neighbour closest to the fruit, no lookahead
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def reset(self):
+        pass
+
+    def choose(self):
+        engine = self.engine
+        x, y = engine.body[0]
+        fruit_x, fruit_y = engine.fruit or (x, y)
+        best, best_distance = engine.direction, None
+        for direction, (dx, dy) in enumerate(DIRECTIONS):
+            if direction == OPPOSITE[engine.direction]:
+                continue
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < engine.width and 0 <= ny < engine.height) or engine.is_occupied((nx, ny)):
+                continue
+            distance = abs(fruit_x - nx) + abs(fruit_y - ny)
+            if best_distance is None or distance < best_distance:
+                best, best_distance = direction, distance
+        return best
+
+
+POLICIES = {
+    'random': RandomPolicy,
+    'greedy': GreedyPolicy,
+    'autopilot': Autopilot,
+}
+
+
+def run_chunk(task):
+    # Plays count seeded episodes in a worker and returns one flat record
+    # per episode; the game states never leave the process
+    policy_name, width, height, first_seed, count, max_steps = task
+    engine = SnakeEngine(width, height)
+    policy = POLICIES[policy_name](engine)
+    records = array('q')
+    for seed in range(first_seed, first_seed + count):
+        engine.reset(seed)
+        policy.reset()
+        step = engine.step
+        choose = policy.choose
+        while not engine.done and engine.steps < max_steps:
+            step(choose())
+        cause = engine.cause if engine.done else TIMEOUT
+        records.extend((seed, engine.score, engine.steps, CAUSES.index(cause), len(engine.body)))
+    return policy_name, records
+
+
+def chunk_tasks(policies, episodes, chunk_size, width, height, first_seed, max_steps):
+    # The same seeds for every policy, so that they meet the same apples
+    for start in range(0, episodes, chunk_size):
+        for policy in policies:
+            yield policy, width, height, first_seed + start, min(chunk_size, episodes - start), max_steps
+
+
+class PolicyStats:
+    def __init__(self):
+        self.scores = array('q')
+        self.steps = array('q')
+        self.lengths = array('q')
+        self.causes = Counter()
+
+    def add(self, records):
+        for index in range(0, len(records), len(FIELDS)):
+            seed, score, steps, cause, length = records[index:index + len(FIELDS)]
+            self.scores.append(score)
+            self.steps.append(steps)
+            self.lengths.append(length)
+            self.causes[CAUSES[cause]] += 1
+
+    def distribution(self, values):
+        ordered = sorted(values)
+        return {
+            'mean': sum(ordered) / len(ordered) if ordered else 0.0,
+            'p50': percentile(ordered, 0.50),
+            'p90': percentile(ordered, 0.90),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1] if ordered else 0,
+        }
+
+    def summary(self):
+        episodes = len(self.scores)
+        steps = self.distribution(self.steps)
+        return {
+            'episodes': episodes,
+            'score': self.distribution(self.scores),
+            'steps': steps,
+            'length': self.distribution(self.lengths),
+            'causes': {cause: self.causes[cause] for cause in CAUSES},
+            # The rules do not depend on the tick speed, so a difficulty
+            # only changes how long an episode takes in real time
+            'mean_seconds': {difficulty: steps['mean'] * TICK_MS[difficulty] / 1000 for difficulty in DIFFICULTIES},
+            'score_histogram': dict(sorted(Counter(self.scores).items())),
+        }
+
+
+def run_tournament(policies, episodes, width=20, height=20, first_seed=0, max_steps=None,
+                   chunk_size=100, workers=None, on_records=None):
+    # Returns {policy: PolicyStats} and the wall time taken. on_records is
+    # called in the parent with each chunk's records as they arrive.
+    max_steps = max_steps or width * height * 200
+    stats = {policy: PolicyStats() for policy in policies}
+    tasks = chunk_tasks(policies, episodes, chunk_size, width, height, first_seed, max_steps)
+    started = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        for policy, records in pool.imap_unordered(run_chunk, tasks):
+            stats[policy].add(records)
+            if on_records is not None:
+                on_records(policy, records)
+    return stats, time.perf_counter() - started
+
+
+def print_report(stats, elapsed, workers):
+    total_episodes = sum(len(policy_stats.scores) for policy_stats in stats.values())
+    total_steps = sum(sum(policy_stats.steps) for policy_stats in stats.values())
+    print(f"{total_episodes:,} episodes, {total_steps:,} steps in {elapsed:.1f} s on {workers} worker(s): "
+          f"{total_episodes / elapsed:,.0f} episodes/s, {total_steps / elapsed:,.0f} steps/s")
+    print()
+    print(f"{'policy':<10} {'score mean':>10} {'p50':>6} {'p90':>6} {'p99':>6} {'max':>6} "
+          f"{'steps mean':>11} {'p99':>8} " + ' '.join(f'{cause:>8}' for cause in CAUSES))
+    for policy, policy_stats in stats.items():
+        summary = policy_stats.summary()
+        score, steps = summary['score'], summary['steps']
+        causes = ' '.join(f"{summary['causes'][cause] / max(summary['episodes'], 1):>8.1%}" for cause in CAUSES)
+        print(f"{policy:<10} {score['mean']:>10.2f} {score['p50']:>6} {score['p90']:>6} {score['p99']:>6} "
+              f"{score['max']:>6} {steps['mean']:>11.1f} {steps['p99']:>8} {causes}")
+    print()
+    for policy, policy_stats in stats.items():
+        seconds = policy_stats.summary()['mean_seconds']
+        print(f"{policy:<10} mean episode at " + ', '.join(f"{difficulty} {seconds[difficulty]:.1f} s"
+                                                          for difficulty in DIFFICULTIES))
+
+
+def board_size(value):
+    try:
+        width, height = (int(part) for part in value.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {value!r}")
+    # Room for the three-cell starting snake, which sits left of the
+    # middle column, and a fruit
+    if width < 4 or height < 1:
+        raise argparse.ArgumentTypeError("the board must be at least 4x1")
+    return width, height
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play many headless Snake games on all cores and summarize them")
+    parser.add_argument('--policies', nargs='+', choices=sorted(POLICIES), default=['greedy'])
+    parser.add_argument('--episodes', type=int, default=1000, help="episodes per policy")
+    parser.add_argument('--board', type=board_size, default='20x20', metavar='WIDTHxHEIGHT')
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first episode")
+    parser.add_argument('--max-steps', type=int, help="end an episode as a timeout after this many ticks")
+    parser.add_argument('--chunk', type=int, default=100, help="episodes per task sent to a worker")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument('--results', metavar='FILE', help="stream one CSV row per episode to FILE")
+    parser.add_argument('--summary', metavar='FILE', help="write the aggregated statistics as JSON")
+    args = parser.parse_args(argv)
+
+    width, height = args.board
+    if 'autopilot' in args.policies:
+        # Checked here rather than failing in every worker
+        try:
+            hamiltonian_cycle(width, height)
+        except ValueError as error:
+            parser.error(f"the autopilot cannot play: {error}")
+
+    on_records = None
+    results_file = None
+    if args.results:
+        results_file = open(args.results, 'w', newline='')
+        writer = csv.writer(results_file)
+        writer.writerow(('policy',) + FIELDS)
+
+        def on_records(policy, records):
+            for index in range(0, len(records), len(FIELDS)):
+                row = list(records[index:index + len(FIELDS)])
+                row[3] = CAUSES[row[3]]
+                writer.writerow([policy] + row)
+
+    try:
+        stats, elapsed = run_tournament(args.policies, args.episodes, width, height, args.seed, args.max_steps,
+                                        args.chunk, args.workers, on_records)
+    finally:
+        if results_file is not None:
+            results_file.close()
+
+    print_report(stats, elapsed, args.workers)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump({
+                'board': [width, height],
+                'first_seed': args.seed,
+                'workers': args.workers,
+                'seconds': elapsed,
+                'policies': {policy: policy_stats.summary() for policy, policy_stats in stats.items()},
+            }, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
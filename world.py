@@ -0,0 +1,192 @@
+import random
+from array import array
+from collections import deque
+
+from engine import DIRECTIONS, OPPOSITE, WALL, SELF
+
+START_LENGTH = 3
+# A snake running into another snake's body
+BODY = 'body'
+# Two heads arriving on the same cell in the same tick
+HEAD_ON = 'head-on'
+# Random cells tried when looking for room to spawn a snake
+SPAWN_ATTEMPTS = 100
+# Ticks a dead snake waits before it may come back
+RESPAWN_TICKS = 10
+# Owner of a cell no snake is on
+NO_OWNER = -1
+
+
+class Snake:
+    def __init__(self, snake_id, body, direction):
+        self.id = snake_id
+        self.body = deque(body)
+        self.direction = direction
+        self.next_direction = direction
+        self.grow = 0
+
+
+class Delta:
+    # What one World.step changed. Clients that apply the parts in this
+    # order rebuild the board exactly: spawns, tails, deaths, eaten fruit,
+    # heads, new fruit.
+
+    def __init__(self, tick):
+        self.tick = tick
+        self.spawns = []        # (snake id, cells head first)
+        self.moves = []         # (snake id, direction of the new head)
+        self.grew = []          # ids of movers that kept their tail
+        self.deaths = []        # (snake id, cause); the whole body is gone
+        self.fruit_removed = []
+        self.fruit_added = []
+
+
+class World:
+    # The rules of a board shared by many snakes, with no pygame or network
+    # code. Cells are numbered y * width + x. Every snake moves at once each
+    # step: tails leave first, so a head may take a cell a tail is leaving,
+    # then heads landing on a wall, a body or another head die.
+
+    def __init__(self, width, height, seed=None, fruit_count=1):
+        self.width = width
+        self.height = height
+        self.fruit_count = fruit_count
+        self.rng = random.Random(seed)
+        cells = width * height
+        # Id of the snake on each cell, or NO_OWNER. Every collision is a
+        # lookup here; no body is ever scanned.
+        self.owner = array('i', [NO_OWNER]) * cells
+        # Cells holding neither snake nor fruit, as in SnakeEngine
+        self.free = list(range(cells))
+        self.free_index = list(range(cells))
+        self.fruits = set()
+        self.snakes = {}
+        self.tick = 0
+        self.pending = Delta(1)
+        self.place_fruits()
+
+    def take_cell(self, cell):
+        index = self.free_index[cell]
+        last = self.free.pop()
+        if last != cell:
+            self.free[index] = last
+            self.free_index[last] = index
+        self.free_index[cell] = -1
+
+    def release_cell(self, cell):
+        self.free_index[cell] = len(self.free)
+        self.free.append(cell)
+
+    def place_fruits(self):
+        while len(self.fruits) < self.fruit_count and self.free:
+            cell = self.free[self.rng.randrange(len(self.free))]
+            self.take_cell(cell)
+            self.fruits.add(cell)
+            self.pending.fruit_added.append(cell)
+
+    def add_snake(self, snake_id, length=START_LENGTH):
+        # Spawns a straight snake on a random empty stretch with room ahead
+        # of it. Returns the snake, or None when no room turned up.
+        width, height = self.width, self.height
+        for _ in range(SPAWN_ATTEMPTS):
+            if not self.free:
+                return None
+            cell = self.free[self.rng.randrange(len(self.free))]
+            direction = self.rng.randrange(4)
+            dx, dy = DIRECTIONS[direction]
+            x, y = cell % width, cell // width
+            # Head first, with one more empty cell in front of it
+            cells = []
+            for index in range(-1, length):
+                cx, cy = x - dx * index, y - dy * index
+                if not (0 <= cx < width and 0 <= cy < height) or self.free_index[cy * width + cx] < 0:
+                    break
+                cells.append(cy * width + cx)
+            else:
+                body = cells[1:]
+                for cell in body:
+                    self.owner[cell] = snake_id
+                    self.take_cell(cell)
+                snake = Snake(snake_id, body, direction)
+                self.snakes[snake_id] = snake
+                self.pending.spawns.append((snake_id, body))
+                return snake
+        return None
+
+    def remove_snake(self, snake_id, cause=None):
+        snake = self.snakes.pop(snake_id, None)
+        if snake is None:
+            return
+        for cell in snake.body:
+            self.owner[cell] = NO_OWNER
+            self.release_cell(cell)
+        self.pending.deaths.append((snake_id, cause))
+
+    def turn(self, snake_id, direction):
+        # Takes effect on the next step; turning back is ignored then
+        snake = self.snakes.get(snake_id)
+        if snake is not None:
+            snake.next_direction = direction
+
+    def step(self):
+        # Advances every snake one cell and returns the Delta
+        width, height = self.width, self.height
+        owner = self.owner
+        delta = self.pending
+        snakes = list(self.snakes.values())
+
+        targets = []
+        kept_tail = set()
+        for snake in snakes:
+            if snake.next_direction != OPPOSITE[snake.direction]:
+                snake.direction = snake.next_direction
+            if snake.grow:
+                snake.grow -= 1
+                kept_tail.add(snake.id)
+            else:
+                cell = snake.body.pop()
+                owner[cell] = NO_OWNER
+                self.release_cell(cell)
+            head = snake.body[0]
+            dx, dy = DIRECTIONS[snake.direction]
+            x, y = head % width + dx, head // width + dy
+            targets.append(y * width + x if 0 <= x < width and 0 <= y < height else -1)
+
+        # Only the cells heads move into are looked at, so a step costs
+        # O(snakes) however long the bodies are
+        arrivals = {}
+        for cell in targets:
+            arrivals[cell] = arrivals.get(cell, 0) + 1
+
+        dead = []
+        for snake, cell in zip(snakes, targets):
+            if cell < 0:
+                dead.append((snake, WALL))
+            elif owner[cell] != NO_OWNER:
+                dead.append((snake, SELF if owner[cell] == snake.id else BODY))
+            elif arrivals[cell] > 1:
+                dead.append((snake, HEAD_ON))
+            else:
+                snake.body.appendleft(cell)
+                owner[cell] = snake.id
+                if cell in self.fruits:
+                    self.fruits.discard(cell)
+                    delta.fruit_removed.append(cell)
+                    snake.grow += 1
+                else:
+                    self.take_cell(cell)
+                delta.moves.append((snake.id, snake.direction))
+                if snake.id in kept_tail:
+                    delta.grew.append(snake.id)
+
+        for snake, cause in dead:
+            self.remove_snake(snake.id, cause)
+        self.place_fruits()
+
+        self.tick = delta.tick
+        self.pending = Delta(self.tick + 1)
+        return delta
+
+    def score(self, snake_id):
+        snake = self.snakes.get(snake_id)
+        return len(snake.body) - START_LENGTH if snake is not None else None